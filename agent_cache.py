@@ -0,0 +1,54 @@
+import hashlib
+import json
+from collections import OrderedDict
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langgraph.prebuilt import create_react_agent
+from env import agent_cache_size
+from metrics import metrics
+
+agent_cache_requests = metrics.counter(
+    "mcp_playground_agent_cache_requests_total",
+    "Agent cache lookups by result.", ("result", ))
+agent_cache_entries = metrics.gauge("mcp_playground_agent_cache_entries",
+                                    "Agents currently cached.")
+
+
+def llm_cache_key(llm: BaseChatModel) -> tuple:
+    api_key = getattr(llm, "openai_api_key", None)
+    if hasattr(api_key, "get_secret_value"):
+        api_key = api_key.get_secret_value()
+    return (type(llm).__name__,
+            json.dumps(llm._identifying_params, sort_keys=True, default=str),
+            getattr(llm, "openai_api_base", None),
+            hashlib.sha256(str(api_key).encode()).hexdigest())
+
+
+class AgentCache:
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._agents = OrderedDict()
+
+    def get(self, llm: BaseChatModel, tools_key: tuple, tools: list,
+            sys_prompt: str):
+        key = (llm_cache_key(llm), tools_key, sys_prompt)
+        agent = self._agents.get(key)
+        if agent is not None:
+            agent_cache_requests.inc(result="hit")
+            self._agents.move_to_end(key)
+            return agent
+        agent_cache_requests.inc(result="miss")
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", sys_prompt),
+            MessagesPlaceholder(variable_name="messages"),
+        ])
+        agent = create_react_agent(llm, tools, prompt=prompt)
+        self._agents[key] = agent
+        while len(self._agents) > self.max_size:
+            self._agents.popitem(last=False)
+        agent_cache_entries.set(len(self._agents))
+        return agent
+
+
+agent_cache = AgentCache(max_size=agent_cache_size)
@@ -3,60 +3,68 @@ import modelscope_studio.components.base as ms
 import modelscope_studio.components.antd as antd
 import modelscope_studio.components.pro as pro
 import modelscope_studio.components.antdx as antdx
+import asyncio
 import json
-from langchain.chat_models import init_chat_model
+import uuid
+import uvicorn
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI
 from exceptiongroup import ExceptionGroup
 from ui_components.config_form import ConfigForm
 from ui_components.mcp_servers_button import McpServersButton
-from mcp_client import generate_with_mcp, get_mcp_prompts
+from mcp_client import generate_with_mcp, merge_mcp_config, parse_mcp_config, stream_mcp_prompts
 from config import bot_config, default_mcp_config, default_mcp_prompts, default_mcp_servers, user_config, welcome_config, default_theme, default_locale, bot_avatars, primary_color, mcp_prompt_model
-from env import api_key, internal_mcp_config, llm_api_key, llm_base_url, llm_model_name
-
-
-def merge_mcp_config(mcp_config1, mcp_config2):
-    return {
-        "mcpServers": {
-            **mcp_config1.get("mcpServers", {}),
-            **mcp_config2.get("mcpServers", {})
-        }
-    }
-
-
-def format_messages(messages):
-    formatted_messages = []
-    for message in messages:
-        if message["role"] == "user":
-            formatted_messages.append({
-                "role": "user",
-                "content": message["content"]
-            })
-        elif message["role"] == "assistant":
-            formatted_messages.append({
-                "role":
-                "assistant",
-                "content":
-                "\n".join([
-                    content["content"] for content in message["content"]
-                    if content["type"] == "text"
-                ])
-            })
-    return formatted_messages
-
-
-async def submit(input_value, config_form_value, mcp_config_value,
-                 mcp_servers_btn_value, chatbot_value):
+from env import internal_mcp_config, llm_api_key, llm_base_url, llm_model_name, chat_stream_max_fps, chat_stream_max_pending_chars, server_name, server_port, timing_footer, headless_api_key
+from streaming import MessageAccumulator, coalesce_frames
+from tool_output import preview_tool_output
+from routes import router
+from openai_api import router as openai_router
+from warmup import start_warm_up
+from scheduler import scheduler
+from conversation_store import conversation_store
+from metrics import QueueTimingMiddleware, TurnTrace, queue_wait_seconds
+from llm_pool import chat_models, get_chat_model
+from context_manager import context_budget_for
+
+
+def is_frame_boundary(chunk):
+    # 工具调用开始和工具结果返回时立即刷新，避免界面停留在中间状态
+    return chunk["type"] == "tool" or (chunk["type"] == "tool_call_chunks"
+                                       and bool(chunk["name"]))
+
+
+busy_message = "该对话正在其他页面中生成回复，请稍后再试"
+
+
+def _conversation(chat_session_value, request: gr.Request = None):
+    # 浏览器尚未分配会话ID时使用 Gradio 会话
+    return conversation_store.get(chat_session_value or (
+        request.session_hash if request else "default"))
+
+
+async def submit(input_value,
+                 config_form_value,
+                 mcp_config_value,
+                 mcp_servers_btn_value,
+                 chat_session_value,
+                 request: gr.Request = None):
+    trace = TurnTrace(queue_wait=queue_wait_seconds(request))
+    conversation = _conversation(chat_session_value, request)
+    chatbot_value = conversation.messages
     model = config_form_value.get("model", "")
     sys_prompt = config_form_value.get("sys_prompt", "")
-    
-    # 确定是否使用本地模型
-    use_local_model = model.startswith("local/")
 
     enabled_mcp_servers = [
         item["name"] for item in mcp_servers_btn_value["data_source"]
         if item.get("enabled") and not item.get("disabled")
     ]
+    # 同一浏览器的多个标签页共用一个会话，同一时间只允许一轮对话
+    if not conversation_store.begin_turn(
+            conversation.session_id,
+            request.session_hash if request else None):
+        raise gr.Error(busy_message)
     if input_value:
-        chatbot_value.append({
+        conversation.append({
             "role":
             "user",
             "content":
@@ -65,135 +73,186 @@ async def submit(input_value, config_form_value, mcp_config_value,
             dict(content="user-message-content")
         })
 
-    chatbot_value.append({
+    # 本轮回复的消息对象，之后的更新都写到这里，不依赖它在列表中的位置
+    reply = {
         "role": "assistant",
         "loading": True,
         "content": [],
         "header": model.split("/")[1],
         "avatar": bot_avatars.get(model, None),
         "status": "pending"
-    })
-    yield gr.update(
-        loading=True, value=None), gr.update(disabled=True), gr.update(
-            value=chatbot_value,
-            bot_config=bot_config(
-                disabled_actions=['edit', 'retry', 'delete']),
-            user_config=user_config(disabled_actions=['edit', 'delete']))
+    }
+    conversation.append(reply)
+    message = MessageAccumulator(reply["content"])
+    turn_stats = {}
+    status = "error"
+    error = None
     try:
-        prev_chunk_type = None
-        tool_name = ""
-        tool_args = ""
-        tool_content = ""
-        async for chunk in generate_with_mcp(
-                format_messages(chatbot_value[:-1]),
-                mcp_config=merge_mcp_config(json.loads(mcp_config_value),
-                                            internal_mcp_config),
-                enabled_mcp_servers=enabled_mcp_servers,
-                sys_prompt=sys_prompt,
-                get_llm=lambda: init_chat_model(
-                    model=llm_model_name if use_local_model else model,
-                    model_provider="openai",
-                    api_key=llm_api_key if use_local_model else api_key,
-                    base_url=llm_base_url if use_local_model else "https://api-inference.modelscope.cn/v1/")):
-            chatbot_value[-1]["loading"] = False
-            current_content = chatbot_value[-1]["content"]
-
-            if prev_chunk_type != chunk["type"] and not (
-                    prev_chunk_type == "tool_call_chunks"
-                    and chunk["type"] == "tool"):
-                current_content.append({})
-            prev_chunk_type = chunk["type"]
-            if chunk["type"] == "content":
-                current_content[-1]['type'] = "text"
-                if not isinstance(current_content[-1].get("content"), str):
-                    current_content[-1]['content'] = ''
-                current_content[-1]['content'] += chunk['content']
-            elif chunk["type"] == "tool":
-                if not isinstance(current_content[-1].get("content"), str):
-                    current_content[-1]['content'] = ''
-                chunk_content = chunk["content"]
-                current_content[-1]["content"] = current_content[-1][
-                    "content"] + f'\n\n**🎯 结果**\n```\n{chunk_content}\n```'
-                tool_name = ""
-                tool_args = ""
-                tool_content = ""
-                current_content[-1]['options']["status"] = "done"
-            elif chunk["type"] == "tool_call_chunks":
-                current_content[-1]['type'] = "tool"
-                current_content[-1]['editable'] = False
-                current_content[-1]['copyable'] = False
-                if not isinstance(current_content[-1].get("options"), dict):
-                    current_content[-1]['options'] = {
-                        "title": "",
-                        "status": "pending"
-                    }
-                if chunk["next_tool"]:
-                    tool_name += ' '
-                    tool_content = tool_content + f"**📝 参数**\n```json\n{tool_args}\n```\n\n"
-                    tool_args = ""
-                if chunk["name"]:
-                    tool_name += chunk["name"]
-                    current_content[-1]['options'][
-                        "title"] = f"**🔧 调用 MCP 工具** `{tool_name}`"
-                if chunk["content"]:
-                    tool_args += chunk["content"]
-                    current_content[-1][
-                        'content'] = tool_content + f"**📝 参数**\n```json\n{tool_args}\n```"
-
-            yield gr.skip(), gr.skip(), gr.update(value=chatbot_value)
+        yield gr.update(
+            loading=True, value=None), gr.update(disabled=True), gr.update(
+                value=chatbot_value,
+                bot_config=bot_config(
+                    disabled_actions=['edit', 'retry', 'delete']),
+                user_config=user_config(disabled_actions=['edit', 'delete']))
+        async with scheduler.slot(
+                model,
+                user=request.session_hash if request else None,
+                trace=trace):
+            async with aclosing(coalesce_frames(
+                    generate_with_mcp(
+                        conversation.history(conversation.index(reply)),
+                        mcp_config=merge_mcp_config(
+                            json.loads(mcp_config_value), internal_mcp_config),
+                        enabled_mcp_servers=enabled_mcp_servers,
+                        sys_prompt=sys_prompt,
+                        get_llm=lambda: get_chat_model(model),
+                        context_budget=context_budget_for(model),
+                        trace=trace,
+                        session_id=conversation.session_id),
+                    max_fps=chat_stream_max_fps,
+                    max_pending_chars=chat_stream_max_pending_chars,
+                    is_boundary=is_frame_boundary,
+                    on_cancel=lambda seconds: trace.record(
+                        "cancel_teardown", seconds))) as frames:
+                async for frame in frames:
+                    reply["loading"] = False
+                    for chunk in frame:
+                        if chunk["type"] == "stats":
+                            turn_stats.update(chunk)
+                            continue
+                        if chunk["type"] == "tool":
+                            content, link = preview_tool_output(
+                                chunk["content"])
+                            chunk = {**chunk, "content": content, "link": link}
+                        message.add(chunk)
+                    message.materialize()
+                    yield gr.skip(), gr.skip(), gr.update(value=chatbot_value)
+        status = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        # 停止对话时 Gradio 会取消当前任务，停在 yield 处时则会关闭生成器；
+        # LLM 请求、工具调用和 MCP 会话已在上面释放
+        status = "cancelled"
+        print('Turn cancelled, teardown: ',
+              round(trace.spans.get("cancel_teardown", 0.0), 3))
+        raise
     except ExceptionGroup as eg:
-        e = eg.exceptions[0]
-        chatbot_value[-1]["loading"] = False
-        chatbot_value[-1]["content"] += [{
-            "type":
-            "text",
-            "content":
-            f'<span style="color: var(--color-red-500)">{str(e)}</span>'
-        }]
-        print('Error: ', e)
-        raise gr.Error(str(e))
+        error = eg.exceptions[0]
     except Exception as e:
-        chatbot_value[-1]["loading"] = False
-        chatbot_value[-1]["content"] += [{
-            "type":
-            "text",
-            "content":
-            f'<span style="color: var(--color-red-500)">{str(e)}</span>'
-        }]
-        print('Error: ', e)
-        raise gr.Error(str(e))
+        error = e
     finally:
-        chatbot_value[-1]["status"] = "done"
-        yield gr.update(loading=False), gr.update(disabled=False), gr.update(
-            value=chatbot_value,
-            bot_config=bot_config(),
-            user_config=user_config())
-
-
-def cancel(chatbot_value):
-    chatbot_value[-1]["loading"] = False
-    chatbot_value[-1]["status"] = "done"
-    chatbot_value[-1]["footer"] = "对话已暂停"
+        if error is not None:
+            reply["loading"] = False
+            reply["content"] += [{
+                "type":
+                "text",
+                "content":
+                f'<span style="color: var(--color-red-500)">{str(error)}</span>'
+            }]
+            print('Error: ', error)
+        message.materialize()
+        reply["status"] = "done"
+        if turn_stats.get("prefix"):
+            print('Prefix: ', turn_stats["prefix"])
+        trace.finish(status)
+        footer = []
+        if turn_stats.get("unavailable"):
+            footer.append(
+                f"以下 MCP Server 暂不可用，本轮未使用：{', '.join(turn_stats['unavailable'])}"
+            )
+        if turn_stats.get("context"):
+            footer.append(
+                f"历史消息已压缩，节省 {turn_stats['context']['saved_tokens']} tokens"
+            )
+        if timing_footer:
+            footer.append(trace.footer())
+        if footer:
+            reply["footer"] = " · ".join(footer)
+        index = conversation.index(reply)
+        if index is not None:
+            conversation.refresh(index)
+        try:
+            await conversation_store.save(conversation)
+        finally:
+            conversation_store.end_turn(conversation.session_id)
+    # 已取消的对话不会执行到这里，界面由 cancel 负责恢复
     yield gr.update(loading=False), gr.update(disabled=False), gr.update(
+        value=chatbot_value, bot_config=bot_config(), user_config=user_config())
+    if error is not None:
+        raise gr.Error(str(error))
+
+
+async def cancel(chat_session_value, request: gr.Request = None):
+    conversation = _conversation(chat_session_value, request)
+    chatbot_value = conversation.messages
+    # 另一个标签页的对话仍在进行时，不修改它的消息
+    owner = conversation_store.turn_owner(conversation.session_id)
+    if chatbot_value and owner in (None,
+                                   request.session_hash if request else None):
+        chatbot_value[-1]["loading"] = False
+        chatbot_value[-1]["status"] = "done"
+        chatbot_value[-1]["footer"] = "对话已暂停"
+        await conversation_store.save(conversation)
+    return gr.update(loading=False), gr.update(disabled=False), gr.update(
         value=chatbot_value,
         bot_config=bot_config(),
         user_config=user_config())
 
 
 async def retry(config_form_value, mcp_config_value, mcp_servers_btn_value,
-                chatbot_value, e: gr.EventData):
+                chat_session_value, e: gr.EventData, request: gr.Request):
     index = e._data["payload"][0]["index"]
-    chatbot_value = chatbot_value[:index]
+    conversation = _conversation(chat_session_value, request)
+    if conversation_store.busy(conversation.session_id):
+        raise gr.Error(busy_message)
+    conversation.truncate(index)
 
     async for chunk in submit(None, config_form_value, mcp_config_value,
-                              mcp_servers_btn_value, chatbot_value):
+                              mcp_servers_btn_value, conversation.session_id,
+                              request):
         yield chunk
 
 
-def clear():
+async def edit_message(chat_session_value,
+                       e: gr.EventData,
+                       request: gr.Request = None):
+    # 界面中已完成编辑，这里同步到服务端的对话
+    conversation = _conversation(chat_session_value, request)
+    if conversation_store.busy(conversation.session_id):
+        raise gr.Error(busy_message)
+    payload = e._data["payload"][0]
+    if 0 <= payload["index"] < len(conversation.messages):
+        conversation.edit(payload["index"], payload["value"])
+        await conversation_store.save(conversation)
+
+
+async def delete_message(chat_session_value,
+                         e: gr.EventData,
+                         request: gr.Request = None):
+    conversation = _conversation(chat_session_value, request)
+    if conversation_store.busy(conversation.session_id):
+        raise gr.Error(busy_message)
+    payload = e._data["payload"][0]
+    if 0 <= payload["index"] < len(conversation.messages):
+        conversation.delete(payload["index"])
+        await conversation_store.save(conversation)
+
+
+async def clear(chat_session_value, request: gr.Request = None):
+    conversation = _conversation(chat_session_value, request)
+    if conversation_store.busy(conversation.session_id):
+        raise gr.Error(busy_message)
+    conversation.truncate(0)
+    await conversation_store.save(conversation)
     return gr.update(value=None)
 
 
+async def load_session(chat_session_value):
+    # 浏览器只保存会话ID，刷新页面后从服务端恢复对话
+    session_id = chat_session_value or uuid.uuid4().hex
+    return gr.update(value=session_id), gr.update(
+        value=conversation_store.get(session_id).messages)
+
+
 def select_welcome_prompt(e: gr.EventData):
     return gr.update(value=e._data["payload"][0]["value"]["description"])
 
@@ -255,14 +314,26 @@ def save_mcp_config_wrapper(initial: bool):
                     value=mcp_servers_btn_value), gr.skip()
             if not initial:
                 gr.Success("保存成功")
-            prompts = await get_mcp_prompts(
-                mcp_config=merge_mcp_config(mcp_config, internal_mcp_config),
-                get_llm=lambda: init_chat_model(
-                    model=llm_model_name,
-                    model_provider="openai",
-                    api_key=llm_api_key,
-                    base_url=llm_base_url))
-
+            merged_mcp_config = merge_mcp_config(mcp_config,
+                                                 internal_mcp_config)
+            mcp_names = list(parse_mcp_config(merged_mcp_config).keys())
+            prompts = {}
+            async for mcp_name, examples in stream_mcp_prompts(
+                    mcp_config=merged_mcp_config,
+                    get_llm=lambda: chat_models.get(
+                        llm_model_name, llm_base_url, llm_api_key)):
+                prompts[mcp_name] = examples
+                if len(prompts) < len(mcp_names):
+                    yield gr.update(welcome_config=welcome_config(
+                        {
+                            name: prompts[name]
+                            for name in mcp_names if name in prompts
+                        },
+                        loading=True,
+                        progress=(len(prompts), len(mcp_names)))), gr.skip(
+                        ), gr.skip()
+
+            prompts = {name: prompts[name] for name in mcp_names}
             browser_state_value["mcp_prompts"] = prompts
             yield gr.update(
                 welcome_config=welcome_config(prompts)), gr.skip(), gr.update(
@@ -341,6 +412,7 @@ with gr.Blocks(css=css) as demo:
             "mcp_servers": default_mcp_servers
         },
         storage_key="mcp_config")
+    chat_session = gr.BrowserState("", storage_key="mcp_chat_session")
 
     with ms.Application(), antdx.XProvider(
             locale=default_locale, theme=default_theme), ms.AutoLoading():
@@ -424,14 +496,23 @@ with gr.Blocks(css=css) as demo:
         inputs=[mcp_servers_btn, browser_state, url_mcp_config],
         outputs=[mcp_config, chatbot, mcp_servers_btn])
 
+    demo.load(fn=load_session,
+              inputs=[chat_session],
+              outputs=[chat_session, chatbot])
+
     chatbot.welcome_prompt_select(fn=select_welcome_prompt,
                                   outputs=[input],
                                   queue=False)
     retry_event = chatbot.retry(
         fn=retry,
-        inputs=[config_form, mcp_config, mcp_servers_btn, chatbot],
+        inputs=[config_form, mcp_config, mcp_servers_btn, chat_session],
         outputs=[input, clear_btn, chatbot])
-    clear_btn.click(fn=clear, outputs=[chatbot], queue=False)
+    chatbot.edit(fn=edit_message, inputs=[chat_session], queue=False)
+    chatbot.delete(fn=delete_message, inputs=[chat_session], queue=False)
+    clear_btn.click(fn=clear,
+                    inputs=[chat_session],
+                    outputs=[chatbot],
+                    queue=False)
     mcp_servers_btn.change(fn=save_mcp_servers,
                            inputs=[mcp_servers_btn, browser_state],
                            outputs=[browser_state])
@@ -452,13 +533,32 @@ with gr.Blocks(css=css) as demo:
         cancels=[save_mcp_config_event, load_success_save_mcp_config_event])
     submit_event = input.submit(
         fn=submit,
-        inputs=[input, config_form, mcp_config, mcp_servers_btn, chatbot],
+        inputs=[input, config_form, mcp_config, mcp_servers_btn, chat_session],
         outputs=[input, clear_btn, chatbot])
     input.cancel(fn=cancel,
-                 inputs=[chatbot],
+                 inputs=[chat_session],
                  outputs=[input, clear_btn, chatbot],
                  cancels=[submit_event, retry_event],
                  queue=False)
 
-demo.queue(default_concurrency_limit=100, max_size=100).launch(ssr_mode=False,
-                                                               max_threads=100)
+# 对话的并发和排队由 scheduler 按模型端点控制
+demo.queue(default_concurrency_limit=None)
+demo.max_threads = 100
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_warm_up()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(QueueTimingMiddleware)
+app.include_router(router)
+# 未配置 HEADLESS_API_KEY 时不挂载 OpenAI 兼容接口
+if headless_api_key:
+    app.include_router(openai_router)
+app = gr.mount_gradio_app(app, demo, path="/", ssr_mode=False)
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=server_name, port=server_port)
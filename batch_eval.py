@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing
+from config import default_mcp_prompts, default_sys_prompt
+from context_manager import context_budget_for
+from env import internal_mcp_config
+from llm_pool import chat_models, get_chat_model
+from mcp_client import generate_with_mcp, merge_mcp_config
+from mcp_pool import error_message, mcp_session_pool
+from metrics import TurnTrace
+from tool_output import tool_output_text
+
+# 批量评测：从 JSONL 读取用例并发运行 generate_with_mcp，结果逐行写入 JSONL，中断后重新运行会跳过已完成的用例
+# 每行用例：{"id": "...", "prompt": "...", "model": "...", "mcp_servers": [...], "sys_prompt": "..."}
+# 也可以用 "messages" 代替 "prompt" 传入多轮对话，model、mcp_servers、sys_prompt 省略时使用命令行参数
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="用例 JSONL 文件")
+    parser.add_argument("output", help="结果 JSONL 文件，已存在时从中断处继续")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时运行的用例数")
+    parser.add_argument("--model", default=None, help="用例未指定模型时使用的模型")
+    parser.add_argument("--mcp-servers",
+                        default=None,
+                        help="用例未指定时启用的 MCP Server，逗号分隔，省略时启用全部")
+    parser.add_argument("--mcp-config",
+                        default=None,
+                        help="MCP 配置 JSON 文件，与内置配置合并")
+    parser.add_argument("--timeout", type=float, default=300, help="单个用例的超时时间（秒）")
+    parser.add_argument("--max-result-chars",
+                        type=int,
+                        default=2000,
+                        help="结果中每个工具输出保留的最大字符数")
+    parser.add_argument("--retry-errors",
+                        action="store_true",
+                        help="重新运行上次失败的用例")
+    parser.add_argument("--export-defaults",
+                        action="store_true",
+                        help="把 default_mcp_prompts 中的示例写入 input 后退出")
+    return parser.parse_args()
+
+
+def export_defaults(path: str, model: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for mcp_name, prompts in default_mcp_prompts.items():
+            for i, prompt in enumerate(prompts):
+                f.write(
+                    json.dumps(
+                        {
+                            "id": f"{mcp_name}-{i}",
+                            "prompt": prompt,
+                            "model": model,
+                            "mcp_servers": [mcp_name]
+                        },
+                        ensure_ascii=False) + "\n")
+
+
+def finished_ids(path: str, retry_errors: bool) -> set:
+    # 同一用例可能有多行结果（失败后重试），以最后一行为准
+    status = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # 上次运行中断时可能留下不完整的最后一行
+                continue
+            status[result.get("id")] = result.get("error") is None
+    return {
+        item_id
+        for item_id, ok in status.items() if ok or not retry_errors
+    }
+
+
+def ends_with_newline(path: str) -> bool:
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return True
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def read_items(path: str, skip: set):
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", f"line-{line_number}")
+            if item["id"] not in skip:
+                yield item
+
+
+async def run_item(item: dict, args, mcp_config: dict):
+    model = item.get("model") or args.model
+    messages = item.get("messages") or [{
+        "role": "user",
+        "content": item.get("prompt", "")
+    }]
+    enabled_mcp_servers = item.get("mcp_servers", args.mcp_servers)
+    trace = TurnTrace()
+    result = {
+        "id": item["id"],
+        "model": model,
+        "answer": "",
+        "tool_calls": [],
+        "unavailable": None,
+        "usage": None,
+        "error": None
+    }
+    tool_calls = result["tool_calls"]
+    started_at = time.monotonic()
+    first_token_at = None
+    status = "error"
+
+    async def collect():
+        nonlocal first_token_at
+        async with aclosing(
+                generate_with_mcp(
+                    messages,
+                    mcp_config=merge_mcp_config(
+                        item.get("mcp_config") or mcp_config,
+                        internal_mcp_config),
+                    enabled_mcp_servers=enabled_mcp_servers,
+                    sys_prompt=item.get("sys_prompt") or default_sys_prompt,
+                    get_llm=lambda: get_chat_model(model),
+                    context_budget=context_budget_for(model),
+                    trace=trace)) as events:
+            async for event in events:
+                if event["type"] in ("content", "tool_call_chunks"):
+                    first_token_at = first_token_at or time.monotonic()
+                if event["type"] == "content":
+                    result["answer"] += event["content"]
+                elif event["type"] == "tool_call_chunks":
+                    if event["name"]:
+                        tool_calls.append({
+                            "id": event["id"],
+                            "name": event["name"],
+                            "arguments": ""
+                        })
+                    if tool_calls:
+                        tool_calls[-1]["arguments"] += event["content"] or ""
+                elif event["type"] == "tool":
+                    text = tool_output_text(event["content"])
+                    for call in tool_calls:
+                        if call["id"] == event["id"]:
+                            call["result"] = text[:args.max_result_chars]
+                            call["result_chars"] = len(text)
+                elif event["type"] == "stats" and event.get("unavailable"):
+                    result["unavailable"] = event["unavailable"]
+                elif event["type"] == "stats" and event.get("usage"):
+                    result["usage"] = event["usage"]
+
+    try:
+        if not model:
+            raise ValueError("model is required")
+        await asyncio.wait_for(collect(), args.timeout)
+        status = "ok"
+    except asyncio.TimeoutError:
+        result["error"] = f"timed out after {args.timeout}s"
+    except Exception as e:
+        result["error"] = error_message(e)
+    trace.finish(status)
+    result["latency"] = time.monotonic() - started_at
+    result["ttft"] = first_token_at - started_at if first_token_at else None
+    result["timings"] = dict(trace.spans)
+    return result
+
+
+async def run(args):
+    mcp_config = {}
+    if args.mcp_config:
+        with open(args.mcp_config, encoding="utf-8") as f:
+            mcp_config = json.load(f)
+    if isinstance(args.mcp_servers, str):
+        args.mcp_servers = [
+            name.strip() for name in args.mcp_servers.split(",")
+            if name.strip()
+        ]
+    args.concurrency = max(1, args.concurrency)
+    skip = finished_ids(args.output, args.retry_errors)
+    if skip:
+        print(f"Skipping {len(skip)} finished items")
+    # 队列长度有限，用例按需读取，内存占用与输入文件大小无关
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    counts = {"done": 0, "errors": 0}
+
+    async def produce():
+        for item in read_items(args.input, skip):
+            await queue.put(item)
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def consume(output):
+        while (item := await queue.get()) is not None:
+            result = await run_item(item, args, mcp_config)
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            counts["done"] += 1
+            if result["error"]:
+                counts["errors"] += 1
+                print('Error: ', result["id"], result["error"])
+            print(
+                f"[{counts['done']}] {result['id']} {result['latency']:.1f}s"
+            )
+
+    with open(args.output, "a", encoding="utf-8") as output:
+        if not ends_with_newline(args.output):
+            output.write("\n")
+        try:
+            await asyncio.gather(produce(), *[
+                consume(output) for _ in range(args.concurrency)
+            ])
+        finally:
+            await mcp_session_pool.close()
+            await chat_models.aclose()
+    print(f"Finished {counts['done']} items, {counts['errors']} errors")
+
+
+def main():
+    args = parse_args()
+    if args.export_defaults:
+        export_defaults(args.input, args.model)
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
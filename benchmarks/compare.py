@@ -0,0 +1,42 @@
+import argparse
+import json
+
+# 对比两次性能测试结果，例如: python benchmarks/compare.py base.json head.json
+
+metrics = [
+    ("throughput", ("throughput", )),
+    ("latency p50", ("latency", "p50")),
+    ("latency p99", ("latency", "p99")),
+    ("ttft p50", ("ttft", "p50")),
+    ("ttft p99", ("ttft", "p99")),
+    ("rss growth/turn kb", ("memory", "rss_growth_per_turn_kb")),
+    ("peak heap kb", ("memory", "peak_heap_kb")),
+]
+
+
+def lookup(result: dict, path: tuple):
+    for key in path:
+        result = (result or {}).get(key)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.head, encoding="utf-8") as f:
+        head = json.load(f)
+    print(f"{'metric':<20}{'base':>14}{'head':>14}{'change':>10}")
+    for name, path in metrics:
+        base_value, head_value = lookup(base, path), lookup(head, path)
+        if base_value is None or head_value is None:
+            continue
+        change = f"{(head_value - base_value) / base_value:+.1%}" if base_value else ""
+        print(f"{name:<20}{base_value:>14.4f}{head_value:>14.4f}{change:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# 兼容 OpenAI 接口的流式假模型：先按脚本依次调用工具，再逐 token 输出回答
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8932)
+parser.add_argument("--tool-rounds",
+                    type=int,
+                    default=1,
+                    help="每轮对话中模型调用工具的次数")
+parser.add_argument("--tool", default="fetch", help="调用的工具名（不含服务器前缀）")
+parser.add_argument("--first-token-delay",
+                    type=float,
+                    default=0.1,
+                    help="首个 token 前的等待时间（秒）")
+parser.add_argument("--token-delay",
+                    type=float,
+                    default=0.01,
+                    help="相邻 token 之间的间隔（秒）")
+parser.add_argument("--tokens", type=int, default=50, help="回答的 token 数量")
+args = parser.parse_args()
+
+app = FastAPI()
+
+
+def chunk(completion_id: str, model: str, delta: dict, finish_reason=None):
+    return "data: " + json.dumps({
+        "id":
+        completion_id,
+        "object":
+        "chat.completion.chunk",
+        "created":
+        int(time.time()),
+        "model":
+        model,
+        "choices": [{
+            "index": 0,
+            "delta": delta,
+            "finish_reason": finish_reason
+        }]
+    }) + "\n\n"
+
+
+def pick_tool(tools: list):
+    names = [tool["function"]["name"] for tool in tools or []]
+    for name in names:
+        if name == args.tool or name.endswith(f"__TOOL__{args.tool}"):
+            return name
+    return None
+
+
+async def stream(body: dict):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "fake")
+    messages = body.get("messages", [])
+    tool_rounds = sum(1 for message in messages
+                      if message.get("role") == "assistant"
+                      and message.get("tool_calls"))
+    tool_name = pick_tool(body.get("tools"))
+    await asyncio.sleep(args.first_token_delay)
+    prompt_tokens = sum(len(str(message.get("content") or "")) // 4
+                        for message in messages)
+    if tool_name and tool_rounds < args.tool_rounds:
+        call_id = f"call_{uuid.uuid4().hex[:24]}"
+        yield chunk(
+            completion_id, model, {
+                "role":
+                "assistant",
+                "tool_calls": [{
+                    "index": 0,
+                    "id": call_id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_name,
+                        "arguments": ""
+                    }
+                }]
+            })
+        for piece in ('{"query": ', f'"round {tool_rounds}"', '}'):
+            await asyncio.sleep(args.token_delay)
+            yield chunk(completion_id, model, {
+                "tool_calls": [{
+                    "index": 0,
+                    "function": {
+                        "arguments": piece
+                    }
+                }]
+            })
+        yield chunk(completion_id, model, {}, "tool_calls")
+        completion_tokens = 3
+    else:
+        yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for i in range(args.tokens):
+            yield chunk(completion_id, model, {"content": f"token{i} "})
+            await asyncio.sleep(args.token_delay)
+        yield chunk(completion_id, model, {}, "stop")
+        completion_tokens = args.tokens
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }) + "\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if body.get("stream"):
+        return StreamingResponse(stream(body), media_type="text/event-stream")
+    # 非流式请求（欢迎页用例、历史摘要）直接返回完整回答
+    await asyncio.sleep(args.first_token_delay)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": " ".join(f"token{i}" for i in range(args.tokens))
+            },
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": 0,
+            "completion_tokens": args.tokens,
+            "total_tokens": args.tokens
+        }
+    }
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "fake", "object": "model"}]}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+from mcp.server.fastmcp import FastMCP
+
+# 替代真实 MCP Server 的本地 SSE 服务，工具耗时和返回大小可配置
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8931)
+parser.add_argument("--latency",
+                    type=float,
+                    default=0.05,
+                    help="每次工具调用的耗时（秒）")
+parser.add_argument("--payload-size",
+                    type=int,
+                    default=2000,
+                    help="fetch 工具返回的字符数")
+parser.add_argument("--tools",
+                    type=int,
+                    default=5,
+                    help="额外注册的同类工具数量，用于模拟较大的工具集")
+args = parser.parse_args()
+
+mcp = FastMCP("benchmark", host=args.host, port=args.port)
+
+
+@mcp.tool()
+async def fetch(query: str) -> str:
+    """Fetch the document that best matches the query."""
+    await asyncio.sleep(args.latency)
+    line = f"result for {query}: " + "lorem ipsum dolor sit amet " * 4
+    return (line * (args.payload_size // len(line) + 1))[:args.payload_size]
+
+
+@mcp.tool()
+async def echo(text: str) -> str:
+    """Echo the text back."""
+    await asyncio.sleep(args.latency)
+    return text
+
+
+def make_tool(i: int):
+
+    async def lookup(key: str) -> str:
+        await asyncio.sleep(args.latency)
+        return f"value {i} for {key}"
+
+    mcp.add_tool(lookup,
+                 name=f"lookup_{i}",
+                 description=f"Look up key in table number {i}.")
+
+
+for i in range(args.tools):
+    make_tool(i)
+
+if __name__ == "__main__":
+    mcp.run(transport="sse")
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# 离线性能测试：启动本地假 MCP Server 和假模型，并发运行 generate_with_mcp 或 app.submit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--scenario",
+                    choices=["generate", "submit"],
+                    default="generate")
+parser.add_argument("--sessions", type=int, default=10, help="并发会话数")
+parser.add_argument("--turns", type=int, default=3, help="每个会话的对话轮数")
+parser.add_argument("--tool-latency", type=float, default=0.05)
+parser.add_argument("--payload-size", type=int, default=2000)
+parser.add_argument("--extra-tools", type=int, default=5)
+parser.add_argument("--tool-rounds", type=int, default=1)
+parser.add_argument("--first-token-delay", type=float, default=0.1)
+parser.add_argument("--token-delay", type=float, default=0.01)
+parser.add_argument("--tokens", type=int, default=50)
+parser.add_argument("--mcp-port", type=int, default=8931)
+parser.add_argument("--llm-port", type=int, default=8932)
+parser.add_argument("--tracemalloc",
+                    action="store_true",
+                    help="统计 Python 堆内存峰值（会明显拖慢运行速度）")
+parser.add_argument("--output",
+                    default=None,
+                    help="结果 JSON 路径，默认写入 benchmarks/results/")
+args = parser.parse_args()
+
+# env.py 在导入时读取环境变量，必须在导入项目模块之前设置
+os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+os.environ["LLM_API_KEY"] = "benchmark"
+os.environ["LLM_MODEL_NAME"] = "fake"
+os.environ.setdefault("CHAT_STREAM_MAX_FPS", "0")
+sys.path.insert(0, root)
+
+benchmark_model = "local/fake"
+benchmark_mcp_config = {
+    "mcpServers": {
+        "benchmark": {
+            "type": "sse",
+            "url": f"http://127.0.0.1:{args.mcp_port}/sse"
+        }
+    }
+}
+
+
+def start_process(script: str, *script_args):
+    return subprocess.Popen(
+        [sys.executable,
+         os.path.join(benchmarks_dir, script), *map(str, script_args)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+
+
+def wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"port {port} did not open within {timeout}s")
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+
+def summarize(values: list):
+    return {
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "p99": percentile(values, 0.99),
+        "mean": sum(values) / len(values) if values else None
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       cwd=root,
+                                       text=True).strip()
+    except Exception:
+        return None
+
+
+async def run_generate_turn(history: list, prompt: str):
+    from llm_pool import get_chat_model
+    from mcp_client import generate_with_mcp
+    history.append({"role": "user", "content": prompt})
+    first_token_at = None
+    content = ""
+    async for chunk in generate_with_mcp(
+            history,
+            mcp_config=benchmark_mcp_config,
+            enabled_mcp_servers=["benchmark"],
+            sys_prompt="You are a helpful assistant.",
+            get_llm=lambda: get_chat_model(benchmark_model)):
+        if chunk["type"] in ("content", "tool_call_chunks"):
+            first_token_at = first_token_at or time.monotonic()
+        if chunk["type"] == "content":
+            content += chunk["content"]
+    history.append({"role": "assistant", "content": content})
+    return first_token_at
+
+
+async def run_submit_turn(history: list, prompt: str):
+    from app import submit
+    # 对话历史保存在服务端，这里用 history 列表的 id 作为会话ID
+    first_token_at = None
+    async for _, _, chatbot in submit(
+            prompt, {
+                "model": benchmark_model,
+                "sys_prompt": "You are a helpful assistant."
+            }, json.dumps(benchmark_mcp_config),
+        {"data_source": [{
+            "name": "benchmark",
+            "enabled": True
+        }]}, f"benchmark-{id(history)}"):
+        value = chatbot.get("value") if isinstance(chatbot, dict) else None
+        if value and value[-1].get("role") == "assistant" and value[-1].get(
+                "content"):
+            first_token_at = first_token_at or time.monotonic()
+    return first_token_at
+
+
+async def run_session(session: int, run_turn, results: list):
+    history = []
+    for turn in range(args.turns):
+        started_at = time.monotonic()
+        try:
+            first_token_at = await run_turn(
+                history, f"session {session} turn {turn}: fetch the report")
+            error = None
+        except Exception as e:
+            first_token_at = None
+            error = str(e)
+        finished_at = time.monotonic()
+        results.append({
+            "session":
+            session,
+            "turn":
+            turn,
+            "latency":
+            finished_at - started_at,
+            "ttft":
+            first_token_at - started_at if first_token_at else None,
+            "error":
+            error
+        })
+
+
+async def run_benchmark():
+    run_turn = run_generate_turn if args.scenario == "generate" else run_submit_turn
+    # 预热一轮，排除模块导入与首次连接的开销
+    await run_turn([], "warm up")
+    gc.collect()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.tracemalloc:
+        tracemalloc.start()
+    results = []
+    started_at = time.monotonic()
+    await asyncio.gather(*[
+        run_session(session, run_turn, results)
+        for session in range(args.sessions)
+    ])
+    elapsed = time.monotonic() - started_at
+    peak_heap = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    succeeded = [result for result in results if not result["error"]]
+    turns = len(results)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": vars(args),
+        "turns": turns,
+        "errors": turns - len(succeeded),
+        "elapsed": elapsed,
+        "throughput": len(succeeded) / elapsed if elapsed else None,
+        "latency": summarize([result["latency"] for result in succeeded]),
+        "ttft":
+        summarize([result["ttft"] for result in succeeded if result["ttft"]]),
+        "memory": {
+            "max_rss_kb": rss_after,
+            "rss_growth_per_turn_kb":
+            (rss_after - rss_before) / turns if turns else None,
+            "peak_heap_kb":
+            peak_heap / 1024 if peak_heap else None
+        },
+        "first_errors": [result["error"] for result in results
+                         if result["error"]][:5]
+    }
+
+
+def main():
+    processes = [
+        start_process("fake_mcp_server.py", "--port", args.mcp_port,
+                      "--latency", args.tool_latency, "--payload-size",
+                      args.payload_size, "--tools", args.extra_tools),
+        start_process("fake_llm.py", "--port", args.llm_port, "--tool-rounds",
+                      args.tool_rounds, "--first-token-delay",
+                      args.first_token_delay, "--token-delay",
+                      args.token_delay, "--tokens", args.tokens)
+    ]
+    try:
+        wait_for_port(args.mcp_port)
+        wait_for_port(args.llm_port)
+        result = asyncio.run(run_benchmark())
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+    output = args.output or os.path.join(
+        benchmarks_dir, "results",
+        f"{args.scenario}-{(result['commit'] or 'unknown')[:12]}-{int(result['timestamp'])}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
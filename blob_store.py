@@ -0,0 +1,70 @@
+import hashlib
+import os
+import re
+import time
+from env import tool_output_blob_dir, tool_output_blob_ttl
+
+blob_handle_pattern = re.compile(r"tool-output://([0-9a-f]{32})")
+
+
+def blob_handle(blob_id: str) -> str:
+    return f"tool-output://{blob_id}"
+
+
+def find_blob_ids(text: str) -> list:
+    return blob_handle_pattern.findall(text or "")
+
+
+class BlobStore:
+
+    def __init__(self, blob_dir: str, ttl: float):
+        self.blob_dir = blob_dir
+        self.ttl = ttl
+        self._last_evicted = 0.0
+
+    def _path(self, blob_id: str) -> str:
+        return os.path.join(self.blob_dir, f"{blob_id}.txt")
+
+    def put(self, text: str) -> str:
+        data = text.encode("utf-8")
+        blob_id = hashlib.sha256(data).hexdigest()[:32]
+        path = self._path(blob_id)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.evict()
+        return blob_id
+
+    def get(self, blob_id: str):
+        if not re.fullmatch(r"[0-9a-f]{32}", blob_id or ""):
+            return None
+        try:
+            with open(self._path(blob_id), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def evict(self):
+        now = time.time()
+        if now - self._last_evicted < 60:
+            return
+        self._last_evicted = now
+        try:
+            names = os.listdir(self.blob_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.blob_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+blob_store = BlobStore(blob_dir=tool_output_blob_dir, ttl=tool_output_blob_ttl)
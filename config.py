@@ -45,6 +45,22 @@ bot_avatars = {
 
 mcp_prompt_model = "Qwen/Qwen2.5-72B-Instruct"
 
+# 每个模型的历史消息 token 预算，未列出的模型使用 CONTEXT_TOKEN_BUDGET
+model_context_budgets = {
+    "local/Qwen2.5-14B-Instruct": 6000,
+    "local/Qwen3-14B": 6000,
+    "local/Qwen3-32B": 12000,
+    "Qwen/Qwen2.5-72B-Instruct": 24000,
+    "Qwen/QwQ-32B": 24000,
+    "deepseek-ai/DeepSeek-V3-0324": 32000,
+    "LLM-Research/Llama-4-Maverick-17B-128E-Instruct": 32000,
+}
+
+# 单个模型端点的调度限制，覆盖 SCHEDULER_* 环境变量中的默认值
+# 键与 /metrics 中的 backend 标签相同：本地模型为 local/<LLM_MODEL_NAME>，其余为 remote/<模型ID>
+# 所有 local/* 模型共用同一个本地端点，例如 {"local/Qwen3-32B": {"max_concurrency": 2, "rate_limit": 0}}
+backend_limits = {}
+
 model_options = [
     {
         "label": "Qwen2.5-14B-Instruct (本地)",
@@ -110,13 +126,16 @@ def bot_config(disabled_actions=None):
                             disabled_actions=disabled_actions)
 
 
-def welcome_config(prompts: dict, loading=False):
+def welcome_config(prompts: dict, loading=False, progress=None):
+    loading_title = "用例生成中..."
+    if progress:
+        loading_title = f"用例生成中 ({progress[0]}/{progress[1]})..."
     return ChatbotWelcomeConfig(
         icon="./assets/mcp.png",
         title="MCP 实验场",
         styles=dict(icon=dict(borderRadius="50%", overflow="hidden")),
         description="调用 MCP 工具以拓展模型能力",
-        prompts=dict(title="用例生成中..." if loading else None,
+        prompts=dict(title=loading_title if loading else None,
                      wrap=True,
                      styles=dict(item=dict(flex='1 0 200px')),
                      items=[{
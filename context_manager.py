@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from langchain_core.language_models import BaseChatModel
+from config import model_context_budgets
+from env import context_token_budget, context_summary_cache_size
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+_encoding_task = None
+
+
+async def _load_encoding():
+    global _encoding
+    try:
+        # 首次加载时会下载 BPE 文件，放到线程中执行，不阻塞事件循环
+        _encoding = await asyncio.to_thread(tiktoken.get_encoding,
+                                            "cl100k_base")
+    except Exception as e:
+        print('Error: ', e)
+        return
+    count_tokens.cache_clear()
+
+
+def load_encoding():
+    # 在后台加载分词器，加载完成前按字符数估计
+    global _encoding_task
+    if _encoding_task is None and tiktoken is not None:
+        _encoding_task = asyncio.ensure_future(_load_encoding())
+    return _encoding_task
+
+
+def get_encoding():
+    return _encoding
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        # 分词器未加载时按字符数粗略估计
+        return len(text) // 2 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message: dict) -> int:
+    # 每条消息额外计入角色等格式开销
+    return count_tokens(message["content"]) + 4
+
+
+def context_budget_for(model: str) -> int:
+    return model_context_budgets.get(model, context_token_budget)
+
+
+def _chain_hashes(messages: list) -> list:
+    hashes = [""]
+    for message in messages:
+        hashes.append(
+            hashlib.sha256((hashes[-1] + json.dumps(
+                [message["role"], message["content"]],
+                ensure_ascii=False)).encode("utf-8")).hexdigest())
+    return hashes
+
+
+class ContextManager:
+
+    def __init__(self, summary_cache_size: int):
+        self.summary_cache_size = summary_cache_size
+        # prefix hash -> summary of messages[:n]
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+
+    def _summary_message(self, summary: str) -> dict:
+        return {
+            "role": "user",
+            "content": f"[Summary of the earlier conversation]\n{summary}"
+        }
+
+    def _get_summary(self, key: str):
+        summary = self._summaries.get(key)
+        if summary is not None:
+            self._summaries.move_to_end(key)
+        return summary
+
+    def _set_summary(self, key: str, summary: str):
+        self._summaries[key] = summary
+        while len(self._summaries) > self.summary_cache_size:
+            self._summaries.popitem(last=False)
+
+    async def _summarize(self, llm: BaseChatModel, previous_summary: str,
+                         messages: list) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}"
+                               for message in messages)
+        prompt = f"""Summarize the following conversation so it can replace the original messages in a chat history.
+        Keep every fact, decision, user preference, tool result and open question that later turns may rely on. Write in the language of the conversation and return only the summary.
+
+        Existing summary of earlier turns:
+        {previous_summary or "(none)"}
+
+        New messages:
+        {transcript}
+        """
+        response = await llm.ainvoke(prompt)
+        if hasattr(response, 'content'):
+            return response.content
+        return str(response)
+
+    async def compact(self, messages: list, llm: BaseChatModel, budget: int,
+                      sys_prompt: str = ""):
+        load_encoding()
+        counts = [count_message_tokens(message) for message in messages]
+        original_tokens = sum(counts)
+        stats = {
+            "original_tokens": original_tokens,
+            "prompt_tokens": original_tokens,
+            "saved_tokens": 0,
+            "summarized_messages": 0
+        }
+        budget = budget - count_tokens(sys_prompt or "")
+        if budget <= 0 or original_tokens <= budget or len(messages) < 2:
+            return messages, stats
+
+        hashes = _chain_hashes(messages)
+        suffix_tokens = [0] * (len(messages) + 1)
+        for i in range(len(messages) - 1, -1, -1):
+            suffix_tokens[i] = suffix_tokens[i + 1] + counts[i]
+
+        def compacted(n: int, summary: str):
+            summary_message = self._summary_message(summary)
+            result = [summary_message] + messages[n:]
+            prompt_tokens = count_message_tokens(
+                summary_message) + suffix_tokens[n]
+            stats.update(prompt_tokens=prompt_tokens,
+                         saved_tokens=original_tokens - prompt_tokens,
+                         summarized_messages=n)
+            return result, stats
+
+        # 优先复用已有摘要，避免每轮都重新生成
+        for n in range(len(messages) - 1, 0, -1):
+            summary = self._get_summary(hashes[n])
+            if summary is not None and count_tokens(
+                    summary) + suffix_tokens[n] <= budget:
+                return compacted(n, summary)
+
+        # 保留最近约一半预算的消息，为后续几轮留出增长空间
+        n = len(messages) - 1
+        while n > 1 and suffix_tokens[n - 1] <= budget // 2:
+            n -= 1
+        while n < len(messages) - 1 and messages[n]["role"] != "user":
+            n += 1
+        previous = 0
+        previous_summary = ""
+        for i in range(n, 0, -1):
+            summary = self._get_summary(hashes[i])
+            if summary is not None:
+                previous, previous_summary = i, summary
+                break
+        try:
+            summary = await self._summarize(llm, previous_summary,
+                                            messages[previous:n])
+        except Exception as e:
+            # 摘要失败不影响本轮对话，直接丢弃较早的消息
+            print('Error: ', e)
+            stats.update(prompt_tokens=suffix_tokens[n],
+                         saved_tokens=original_tokens - suffix_tokens[n],
+                         dropped_messages=n)
+            return messages[n:], stats
+        self._set_summary(hashes[n], summary)
+        return compacted(n, summary)
+
+
+context_manager = ContextManager(summary_cache_size=context_summary_cache_size)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from env import conversation_store_size, conversation_ttl, conversation_db_path
+
+
+def format_message(message: dict):
+    # 界面消息转换为传给模型的消息，工具调用等非文本内容不传给模型
+    if message["role"] == "user":
+        return {"role": "user", "content": message["content"]}
+    if message["role"] == "assistant":
+        content = message["content"]
+        if not isinstance(content, str):
+            content = "\n".join([
+                item["content"] for item in content
+                if item.get("type") == "text"
+            ])
+        return {"role": "assistant", "content": content}
+    return None
+
+
+class Conversation:
+    # messages 是界面中展示的消息，history 是与之逐条对应的模型消息，随对话增量更新
+
+    def __init__(self, session_id: str, messages: list = None):
+        self.session_id = session_id
+        self.messages = messages or []
+        self._history = [format_message(message) for message in self.messages]
+        self.updated_at = time.time()
+
+    def history(self, end: int = None) -> list:
+        return [message for message in self._history[:end] if message]
+
+    def append(self, message: dict):
+        self.messages.append(message)
+        self._history.append(format_message(message))
+
+    def refresh(self, index: int = -1):
+        # 消息内容在原处被修改后（例如流式输出完成）重新生成对应的模型消息
+        self._history[index] = format_message(self.messages[index])
+
+    def index(self, message: dict):
+        # 按对象查找消息的位置，消息已被删除时返回 None
+        return next((i for i, item in enumerate(self.messages)
+                     if item is message), None)
+
+    def edit(self, index: int, content):
+        self.messages[index]["content"] = content
+        self.refresh(index)
+
+    def delete(self, index: int):
+        del self.messages[index]
+        del self._history[index]
+
+    def truncate(self, index: int):
+        del self.messages[index:]
+        del self._history[index:]
+
+
+class ConversationStore:
+
+    def __init__(self, max_size: int, ttl: float, db_path: str = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+        # 正在生成回复的会话ID -> 发起该轮对话的 Gradio 会话
+        self._turns: dict[str, str] = {}
+        self._db = None
+        # 写入在线程中执行，与事件循环中的读取共用一个连接
+        self._db_lock = threading.Lock()
+
+    def _connection(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)),
+                        exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations (session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "DELETE FROM conversations WHERE updated_at < ?",
+                (time.time() - self.ttl, ))
+            self._db.commit()
+        return self._db
+
+    def _load(self, session_id: str):
+        if not self.db_path:
+            return None
+        try:
+            with self._db_lock:
+                row = self._connection().execute(
+                    "SELECT messages, updated_at FROM conversations WHERE session_id = ?",
+                    (session_id, )).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            print('Error: ', e)
+            return None
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        conversation = Conversation(session_id, json.loads(row[0]))
+        conversation.updated_at = row[1]
+        return conversation
+
+    def get(self, session_id: str) -> Conversation:
+        conversation = self._conversations.get(session_id)
+        if conversation is not None and time.time(
+        ) - conversation.updated_at > self.ttl:
+            conversation = None
+        if conversation is None:
+            conversation = self._load(session_id) or Conversation(session_id)
+        self._conversations[session_id] = conversation
+        self._conversations.move_to_end(session_id)
+        while len(self._conversations) > self.max_size:
+            self._conversations.popitem(last=False)
+        return conversation
+
+    def begin_turn(self, session_id: str, owner: str) -> bool:
+        if session_id in self._turns:
+            return False
+        self._turns[session_id] = owner
+        return True
+
+    def end_turn(self, session_id: str):
+        self._turns.pop(session_id, None)
+
+    def busy(self, session_id: str) -> bool:
+        return session_id in self._turns
+
+    def turn_owner(self, session_id: str):
+        return self._turns.get(session_id)
+
+    def _write(self, session_id: str, messages: str, updated_at: float):
+        try:
+            with self._db_lock:
+                db = self._connection()
+                # 写入可能乱序完成，只保留最新的一次
+                db.execute(
+                    "INSERT INTO conversations (session_id, messages, updated_at) VALUES (?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET messages = excluded.messages, updated_at = excluded.updated_at WHERE excluded.updated_at >= conversations.updated_at",
+                    (session_id, messages, updated_at))
+                db.commit()
+        except (sqlite3.Error, OSError) as e:
+            print('Error: ', e)
+
+    async def save(self, conversation: Conversation):
+        conversation.updated_at = time.time()
+        if not self.db_path:
+            return
+        # 在事件循环中序列化当前内容，写入放到线程中执行
+        await asyncio.to_thread(
+            self._write, conversation.session_id,
+            json.dumps(conversation.messages, ensure_ascii=False),
+            conversation.updated_at)
+
+conversation_store = ConversationStore(max_size=conversation_store_size,
+                                       ttl=conversation_ttl,
+                                       db_path=conversation_db_path)
@@ -15,6 +15,10 @@ llm_api_key = os.getenv('LLM_API_KEY', 'your_llm_api_key')
 llm_base_url = os.getenv('LLM_BASE_URL', 'your_llm_base_url')
 llm_model_name = os.getenv('LLM_MODEL_NAME', 'Qwen2.5-14B-Instruct')
 
+# 服务监听地址
+server_name = os.getenv('GRADIO_SERVER_NAME', '127.0.0.1')
+server_port = int(os.getenv('GRADIO_SERVER_PORT', '7860'))
+
 # MCP服务器配置
 mcp_filesystem_path = os.getenv('MCP_FILESYSTEM_PATH', os.path.expanduser('~/Desktop'))
 mcp_filesystem_path2 = os.getenv('MCP_FILESYSTEM_PATH2', os.path.expanduser('~/Documents'))
@@ -49,3 +53,97 @@ internal_mcp_config_obj = {
 
 internal_mcp_config = json.loads(
     os.getenv("INTERNAL_MCP_CONFIG", json.dumps(internal_mcp_config_obj)))
+
+# MCP会话池配置
+mcp_pool_idle_timeout = float(os.getenv('MCP_POOL_IDLE_TIMEOUT', '300'))
+mcp_pool_health_check_interval = float(
+    os.getenv('MCP_POOL_HEALTH_CHECK_INTERVAL', '30'))
+mcp_pool_close_timeout = float(os.getenv('MCP_POOL_CLOSE_TIMEOUT', '5'))
+mcp_tool_list_ttl = float(os.getenv('MCP_TOOL_LIST_TTL', '600'))
+mcp_tool_catalog_size = int(os.getenv('MCP_TOOL_CATALOG_SIZE', '128'))
+mcp_server_max_concurrency = int(os.getenv('MCP_SERVER_MAX_CONCURRENCY', '4'))
+mcp_stdio_pool_size = int(os.getenv('MCP_STDIO_POOL_SIZE', '2'))
+mcp_stdio_idle_timeout = float(os.getenv('MCP_STDIO_IDLE_TIMEOUT', '3600'))
+mcp_connect_timeout = float(os.getenv('MCP_CONNECT_TIMEOUT', '10'))
+mcp_circuit_breaker_cooldown = float(
+    os.getenv('MCP_CIRCUIT_BREAKER_COOLDOWN', '30'))
+mcp_circuit_breaker_max_cooldown = float(
+    os.getenv('MCP_CIRCUIT_BREAKER_MAX_COOLDOWN', '300'))
+
+# 工具结果缓存配置（需在MCP配置中通过 cacheTools 为工具单独开启）
+mcp_tool_cache_ttl = float(os.getenv('MCP_TOOL_CACHE_TTL', '300'))
+mcp_tool_cache_size = int(os.getenv('MCP_TOOL_CACHE_SIZE', '1024'))
+
+# Agent缓存配置
+agent_cache_size = int(os.getenv('AGENT_CACHE_SIZE', '64'))
+
+# LLM客户端连接池配置
+llm_pool_max_connections = int(os.getenv('LLM_POOL_MAX_CONNECTIONS', '100'))
+llm_pool_max_keepalive = int(os.getenv('LLM_POOL_MAX_KEEPALIVE', '20'))
+llm_pool_keepalive_expiry = float(os.getenv('LLM_POOL_KEEPALIVE_EXPIRY', '60'))
+llm_timeout = float(os.getenv('LLM_TIMEOUT', '600'))
+llm_connect_timeout = float(os.getenv('LLM_CONNECT_TIMEOUT', '10'))
+llm_max_retries = int(os.getenv('LLM_MAX_RETRIES', '2'))
+
+# 欢迎页用例缓存配置
+mcp_prompt_cache_dir = os.getenv(
+    'MCP_PROMPT_CACHE_DIR', os.path.join(os.getcwd(), '.cache', 'mcp_prompts'))
+mcp_prompt_cache_ttl = float(os.getenv('MCP_PROMPT_CACHE_TTL',
+                                       str(7 * 24 * 3600)))
+mcp_prompt_cache_size = int(os.getenv('MCP_PROMPT_CACHE_SIZE', '1000'))
+mcp_prompt_timeout = float(os.getenv('MCP_PROMPT_TIMEOUT', '60'))
+
+# 对话流式输出配置
+chat_stream_max_fps = float(os.getenv('CHAT_STREAM_MAX_FPS', '10'))
+chat_stream_max_pending_chars = int(
+    os.getenv('CHAT_STREAM_MAX_PENDING_CHARS', '2048'))
+
+# 工具输出大小限制配置
+tool_output_model_max_chars = int(
+    os.getenv('TOOL_OUTPUT_MODEL_MAX_CHARS', '8000'))
+tool_output_ui_max_chars = int(os.getenv('TOOL_OUTPUT_UI_MAX_CHARS', '4000'))
+tool_output_blob_dir = os.getenv(
+    'TOOL_OUTPUT_BLOB_DIR', os.path.join(os.getcwd(), '.cache', 'tool_outputs'))
+tool_output_blob_ttl = float(os.getenv('TOOL_OUTPUT_BLOB_TTL',
+                                       str(24 * 3600)))
+
+# 对话历史压缩配置
+context_token_budget = int(os.getenv('CONTEXT_TOKEN_BUDGET', '6000'))
+context_summary_cache_size = int(
+    os.getenv('CONTEXT_SUMMARY_CACHE_SIZE', '256'))
+
+# 前缀缓存诊断配置
+prefix_tracker_size = int(os.getenv('PREFIX_TRACKER_SIZE', '64'))
+prefix_diagnostics = os.getenv('PREFIX_DIAGNOSTICS', '0') == '1'
+
+# 启动预热配置
+warmup_enabled = os.getenv('WARMUP_ENABLED', '1') == '1'
+warmup_timeout = float(os.getenv('WARMUP_TIMEOUT', '300'))
+
+# 工具检索配置（工具较多时每轮只挂载最相关的工具）
+tool_retrieval_top_k = int(os.getenv('TOOL_RETRIEVAL_TOP_K', '0'))
+
+# 工具调用提前执行配置（参数流式输出完整后立即调用，不等模型输出结束，仅限 cacheTools 中声明的工具）
+tool_early_dispatch = os.getenv('TOOL_EARLY_DISPATCH', '1') == '1'
+
+# 耗时统计配置
+timing_footer = os.getenv('TIMING_FOOTER', '0') == '1'
+
+# 模型调度配置（按模型端点分别限制并发与速率）
+scheduler_local_max_concurrency = int(
+    os.getenv('SCHEDULER_LOCAL_MAX_CONCURRENCY', '4'))
+scheduler_local_rate_limit = float(os.getenv('SCHEDULER_LOCAL_RATE_LIMIT', '0'))
+scheduler_remote_max_concurrency = int(
+    os.getenv('SCHEDULER_REMOTE_MAX_CONCURRENCY', '16'))
+scheduler_remote_rate_limit = float(
+    os.getenv('SCHEDULER_REMOTE_RATE_LIMIT', '0'))
+scheduler_max_queue = int(os.getenv('SCHEDULER_MAX_QUEUE', '50'))
+scheduler_max_wait = float(os.getenv('SCHEDULER_MAX_WAIT', '120'))
+
+# 对话存储配置（对话内容保存在服务端，浏览器只保存会话ID）
+conversation_store_size = int(os.getenv('CONVERSATION_STORE_SIZE', '1000'))
+conversation_ttl = float(os.getenv('CONVERSATION_TTL', str(7 * 24 * 3600)))
+conversation_db_path = os.getenv('CONVERSATION_DB_PATH', '')
+
+# 兼容 OpenAI 的接口配置（/v1/chat/completions），未设置时不启用该接口，设置后请求需携带 Authorization: Bearer <key>
+headless_api_key = os.getenv('HEADLESS_API_KEY', '')
@@ -0,0 +1,73 @@
+import asyncio
+import httpx
+from langchain.chat_models import init_chat_model
+from langchain_core.language_models import BaseChatModel
+from env import api_key, llm_api_key, llm_base_url, llm_model_name, llm_pool_max_connections, llm_pool_max_keepalive, llm_pool_keepalive_expiry, llm_timeout, llm_connect_timeout, llm_max_retries
+
+modelscope_base_url = "https://api-inference.modelscope.cn/v1/"
+
+
+def resolve_model(model: str):
+    # 本地模型统一走 llm_base_url，其余模型走 ModelScope API-Inference
+    if model.startswith("local/"):
+        return llm_model_name, llm_base_url, llm_api_key
+    return model, modelscope_base_url, api_key
+
+
+class ChatModelRegistry:
+
+    def __init__(self):
+        self._http_clients: dict[str, httpx.AsyncClient] = {}
+        self._models: dict[tuple, BaseChatModel] = {}
+
+    def _http_client(self, base_url: str) -> httpx.AsyncClient:
+        client = self._http_clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=llm_pool_max_connections,
+                    max_keepalive_connections=llm_pool_max_keepalive,
+                    keepalive_expiry=llm_pool_keepalive_expiry),
+                timeout=httpx.Timeout(llm_timeout,
+                                      connect=llm_connect_timeout))
+            self._http_clients[base_url] = client
+            # models bound to a closed client must be rebuilt
+            for key in [key for key in self._models if key[1] == base_url]:
+                del self._models[key]
+        return client
+
+    def get(self, model: str, base_url: str, api_key: str) -> BaseChatModel:
+        http_client = self._http_client(base_url)
+        key = (model, base_url, api_key)
+        llm = self._models.get(key)
+        if llm is None:
+            llm = init_chat_model(model=model,
+                                  model_provider="openai",
+                                  api_key=api_key,
+                                  base_url=base_url,
+                                  timeout=llm_timeout,
+                                  max_retries=llm_max_retries,
+                                  stream_usage=True,
+                                  http_async_client=http_client)
+            self._models[key] = llm
+        return llm
+
+    async def warm_up(self, model: str, base_url: str, api_key: str):
+        # 提前建立到模型端点的 keep-alive 连接
+        self.get(model, base_url, api_key)
+        response = await self._http_client(base_url).get(
+            f"{base_url.rstrip('/')}/models",
+            headers={"Authorization": f"Bearer {api_key}"})
+        return response.status_code
+
+    async def aclose(self):
+        clients, self._http_clients = self._http_clients, {}
+        self._models = {}
+        await asyncio.gather(*[client.aclose() for client in clients.values()])
+
+
+chat_models = ChatModelRegistry()
+
+
+def get_chat_model(model: str) -> BaseChatModel:
+    return chat_models.get(*resolve_model(model))
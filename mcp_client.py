@@ -1,23 +1,40 @@
 from typing import List, Callable
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.language_models import BaseChatModel
-from langgraph.prebuilt import create_react_agent
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp_pool import error_message, mcp_session_pool
+from tool_catalog import tool_catalog
+from agent_cache import agent_cache, llm_cache_key
+from prompt_layout import canonical_sys_prompt, prefix_tracker
+from prompt_cache import prompt_cache, prompt_cache_key
+from context_manager import context_manager
+from tool_retrieval import select_tools
+from tool_dispatch import ToolCallDispatcher
+from metrics import TurnTrace
+from env import internal_mcp_config, mcp_prompt_timeout, context_token_budget, prefix_diagnostics, tool_early_dispatch
+import asyncio
 import json
+import time
+from contextlib import aclosing, nullcontext
 import os
 import re
 
 
+def merge_mcp_config(mcp_config1, mcp_config2):
+    return {
+        "mcpServers": {
+            **mcp_config1.get("mcpServers", {}),
+            **mcp_config2.get("mcpServers", {})
+        }
+    }
+
+
 def parse_mcp_config(mcp_config: dict, enabled_mcp_servers: list = None):
     mcp_servers = {}
+    if enabled_mcp_servers is not None:
+        # 界面中的名称与配置中的名称大小写可能不同，例如 YOLO-tool 与 yolo-tool
+        enabled_mcp_servers = {name.lower() for name in enabled_mcp_servers}
     for server_name, server in mcp_config.get("mcpServers", {}).items():
-        if enabled_mcp_servers is not None and server_name not in enabled_mcp_servers:
-            continue
-            
-        server_type = server.get("type", "sse")
-        
-        if server_type == "stdio":
+        if enabled_mcp_servers is not None and server_name.lower() not in enabled_mcp_servers:
             continue
             
         new_server = {**server}
@@ -25,9 +42,16 @@ def parse_mcp_config(mcp_config: dict, enabled_mcp_servers: list = None):
         if "type" in new_server:
             new_server["transport"] = new_server["type"]
             del new_server["type"]
+        elif "command" in new_server:
+            new_server["transport"] = "stdio"
         else:
             new_server["transport"] = "sse"
-            
+
+        # stdio Server 会在本机启动进程，只允许内置配置中的 Server，用户提供的配置一律忽略
+        if new_server["transport"] == "stdio" and server != internal_mcp_config.get(
+                "mcpServers", {}).get(server_name):
+            continue
+
         if server.get("env"):
             env = {'PYTHONUNBUFFERED': '1', 'PATH': os.environ.get('PATH', '')}
             env.update(server["env"])
@@ -36,56 +60,81 @@ def parse_mcp_config(mcp_config: dict, enabled_mcp_servers: list = None):
     return mcp_servers
 
 
-async def get_mcp_prompts(mcp_config: dict, get_llm: Callable):
-    try:
-        mcp_servers = parse_mcp_config(mcp_config)
-        if len(mcp_servers.keys()) == 0:
-            return {}
-        llm: BaseChatModel = get_llm()
-        async with MultiServerMCPClient(mcp_servers) as client:
-            mcp_tool_descriptions = {}
-            for mcp_name, server_tools in client.server_name_to_tools.items():
-                mcp_tool_descriptions[mcp_name] = {}
-                for tool in server_tools:
-                    mcp_tool_descriptions[mcp_name][
-                        tool.name] = tool.description
-            prompt = f"""Based on the tool descriptions of the following MCP services `{json.dumps(mcp_tool_descriptions)}`, generate 2-4 example user queries for each service:
-
-        Please provide 2-4 natural and specific example queries in Chinese that effectively demonstrate the capabilities of each service.
+def default_mcp_prompt(mcp_name: str):
+    return [
+        f"请使用 {mcp_name} 服务的功能帮我查询信息或解决问题",
+    ]
+
+
+async def _get_server_prompts(mcp_name: str, server: dict,
+                              get_llm: Callable):
+    async with mcp_session_pool.connect({mcp_name: server}) as client:
+        tool_descriptions = {}
+        for tool in client.server_name_to_tools[mcp_name]:
+            tool_descriptions[tool.name] = tool.description
+    cache_key = prompt_cache_key(tool_descriptions)
+    examples = prompt_cache.get(cache_key)
+    if examples:
+        return examples
+    llm: BaseChatModel = get_llm()
+    prompt = f"""Based on the tool descriptions of the MCP service `{mcp_name}`: `{json.dumps(tool_descriptions)}`, generate 2-4 example user queries for this service:
+
+        Please provide 2-4 natural and specific example queries in Chinese that effectively demonstrate the capabilities of the service.
         The response must be in strict JSON format as shown below:
         ```json
-        {{
-            "mcp_name1": ["中文示例1", "中文示例2"],
-            "mcp_name2": ["中文示例1", "中文示例2"]
-        }}
+        ["中文示例1", "中文示例2"]
         ```
-        Return only the JSON object without any additional explanation or text.
+        Return only the JSON array without any additional explanation or text.
         """
-            response = await llm.ainvoke(prompt)
-            if hasattr(response, 'content'):
-                content = response.content
-            else:
-                content = str(response)
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
-            if json_match:
-                json_content = json_match.group(0)
-            else:
-                json_content = content
-            raw_examples = json.loads(json_content)
-
-            for mcp_name in mcp_tool_descriptions.keys():
-                if mcp_name not in raw_examples:
-                    raw_examples[mcp_name] = [
-                        f"请使用 {mcp_name} 服务的功能帮我查询信息或解决问题",
-                    ]
-            return raw_examples
-    except Exception as e:
-        return {
-            mcp_name: [
-                f"请使用 {mcp_name} 服务的功能帮我查询信息或解决问题",
-            ]
-            for mcp_name in mcp_servers.keys()
-        }
+    response = await llm.ainvoke(prompt)
+    if hasattr(response, 'content'):
+        content = response.content
+    else:
+        content = str(response)
+    json_match = re.search(r'\[.*\]', content, re.DOTALL)
+    if json_match:
+        json_content = json_match.group(0)
+    else:
+        json_content = content
+    examples = json.loads(json_content)
+    if not isinstance(examples, list) or not examples:
+        return default_mcp_prompt(mcp_name)
+    examples = [str(example) for example in examples]
+    prompt_cache.set(cache_key, examples)
+    return examples
+
+
+async def stream_mcp_prompts(mcp_config: dict, get_llm: Callable):
+    mcp_servers = parse_mcp_config(mcp_config)
+
+    async def get_server_prompts(mcp_name: str, server: dict):
+        try:
+            return mcp_name, await asyncio.wait_for(
+                _get_server_prompts(mcp_name, server, get_llm),
+                mcp_prompt_timeout)
+        except Exception as e:
+            return mcp_name, default_mcp_prompt(mcp_name)
+
+    tasks = [
+        asyncio.create_task(get_server_prompts(mcp_name, server))
+        for mcp_name, server in mcp_servers.items()
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get_mcp_prompts(mcp_config: dict, get_llm: Callable):
+    prompts = {}
+    async for mcp_name, examples in stream_mcp_prompts(mcp_config, get_llm):
+        prompts[mcp_name] = examples
+    return {
+        mcp_name: prompts[mcp_name]
+        for mcp_name in parse_mcp_config(mcp_config).keys()
+    }
 
 
 def convert_mcp_name(tool_name: str, mcp_names: dict):
@@ -106,29 +155,41 @@ def convert_mcp_name(tool_name: str, mcp_names: dict):
     return f"[{mcp_name}] {mcp_tool_name}"
 
 
-async def generate_with_mcp(messages: List[dict], mcp_config: dict,
-                            enabled_mcp_servers: list, sys_prompt: str,
-                            get_llm: Callable):
+async def generate_with_mcp(messages: List[dict],
+                            mcp_config: dict,
+                            enabled_mcp_servers: list,
+                            sys_prompt: str,
+                            get_llm: Callable,
+                            context_budget: int = context_token_budget,
+                            trace: TurnTrace = None,
+                            session_id: str = None):
+    trace = trace or TurnTrace()
     mcp_servers = parse_mcp_config(mcp_config, enabled_mcp_servers)
-    async with MultiServerMCPClient(mcp_servers) as client:
-        tools = []
-        mcp_tools = []
-        mcp_names = {}
-        for i, server_name_to_tool in enumerate(
-                client.server_name_to_tools.items()):
-            mcp_name, server_tools = server_name_to_tool
-            mcp_names[str(i)] = mcp_name
-            for tool in server_tools:
-                new_tool = tool.model_copy()
-                # tool match ^[a-zA-Z0-9_-]+$
-                new_tool.name = f"{i}__TOOL__{tool.name}"
-                mcp_tools.append(new_tool)
-        tools.extend(mcp_tools)
+    sys_prompt = canonical_sys_prompt(sys_prompt)
+    connect_started = time.monotonic()
+    async with mcp_session_pool.connect(mcp_servers,
+                                        allow_partial=True) as client:
+        trace.record("mcp_connect", time.monotonic() - connect_started)
+        if client.unavailable:
+            # 不可用的 Server 不影响本轮对话，只使用连接成功的部分
+            for mcp_name, e in client.unavailable.items():
+                print('MCP server unavailable: ', mcp_name, error_message(e))
+            yield {
+                "type": "stats",
+                "unavailable": {
+                    mcp_name: error_message(e)
+                    for mcp_name, e in client.unavailable.items()
+                }
+            }
+        with trace.span("tool_catalog"):
+            catalog = tool_catalog.get(client)
+        mcp_names = catalog.mcp_names
         llm: BaseChatModel = get_llm()
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", sys_prompt),
-            MessagesPlaceholder(variable_name="messages"),
-        ])
+        with trace.span("context_compact"):
+            messages, context_stats = await context_manager.compact(
+                messages, llm, context_budget, sys_prompt)
+        if context_stats["saved_tokens"] > 0:
+            yield {"type": "stats", "context": context_stats}
 
         langchain_messages = []
         for msg in messages:
@@ -137,47 +198,121 @@ async def generate_with_mcp(messages: List[dict], mcp_config: dict,
             elif msg["role"] == "assistant":
                 langchain_messages.append(AIMessage(content=msg["content"]))
 
-        agent_executor = create_react_agent(llm, tools, prompt=prompt)
+        query = next((str(msg["content"]) for msg in reversed(messages)
+                      if msg["role"] == "user"), "")
+        selection = select_tools(catalog, query)
         use_tool = False
-        async for step in agent_executor.astream(
-            {"messages": langchain_messages},
-                config={"recursion_limit": 50},
-                stream_mode=["values", "messages"],
-        ):
-            if isinstance(step, tuple):
-                if step[0] == "messages":
-                    message_chunk = step[1][0]
-                    if hasattr(message_chunk, "content"):
-                        if isinstance(message_chunk, ToolMessage):
-                            use_tool = False
-                            yield {
-                                "type":
-                                "tool",
-                                "name":
-                                convert_mcp_name(message_chunk.name,
-                                                 mcp_names),
-                                "content":
-                                message_chunk.content
-                            }
-                        elif hasattr(message_chunk,
-                                     'tool_call_chunks') and len(
-                                         message_chunk.tool_call_chunks) > 0:
-                            for tool_call_chunk in message_chunk.tool_call_chunks:
-                                yield {
-                                    "type":
-                                    "tool_call_chunks",
-                                    "name":
-                                    convert_mcp_name(tool_call_chunk["name"],
-                                                     mcp_names),
-                                    "content":
-                                    tool_call_chunk["args"],
-                                    "next_tool":
-                                    bool(use_tool and tool_call_chunk["name"])
-                                }
-                                if tool_call_chunk["name"]:
-                                    use_tool = True
-                        elif message_chunk.content:
-                            yield {
-                                "type": "content",
-                                "content": message_chunk.content
-                            }
+        # 各步模型调用的 token 用量累计
+        usage = {}
+        while True:
+            if selection is None:
+                tools, tools_key = catalog.tools, catalog.key
+            else:
+                tools, tools_key = selection.tools, (catalog.key,
+                                                     selection.key)
+            with trace.span("agent_build"):
+                agent_executor = agent_cache.get(llm, tools_key, tools,
+                                                 sys_prompt)
+            if prefix_diagnostics:
+                # 按会话（没有会话时按模型端点）对比相邻两次请求，启用的 Server 变化时也能看出前缀复用情况
+                yield {
+                    "type":
+                    "stats",
+                    "prefix":
+                    prefix_tracker.observe(
+                        (llm_cache_key(llm), session_id), tools_key, tools,
+                        sys_prompt, langchain_messages)
+                }
+            widened = False
+            llm_started = time.monotonic()
+            tools_started = None
+            # ToolNode 通过 config 取到同一个 dispatcher，退出时取消未被使用的提前调用
+            async with (ToolCallDispatcher(tools) if tool_early_dispatch else
+                        nullcontext()) as dispatcher, aclosing(
+                            agent_executor.astream(
+                                {"messages": langchain_messages},
+                                config={
+                                    "recursion_limit": 50,
+                                    "configurable": {
+                                        "tool_selection": selection,
+                                        "tool_dispatcher": dispatcher
+                                    }
+                                },
+                                stream_mode=["values", "messages"],
+                            )) as stream:
+                async for step in stream:
+                    if isinstance(step, tuple):
+                        if step[0] == "messages":
+                            message_chunk = step[1][0]
+                            if llm_started is not None and not isinstance(
+                                    message_chunk, ToolMessage):
+                                trace.record("llm_first_token",
+                                             time.monotonic() - llm_started)
+                                llm_started = None
+                            for key, value in (getattr(
+                                    message_chunk, "usage_metadata", None)
+                                               or {}).items():
+                                if isinstance(value, int):
+                                    usage[key] = usage.get(key, 0) + value
+                            if hasattr(message_chunk, "content"):
+                                if isinstance(message_chunk, ToolMessage):
+                                    use_tool = False
+                                    yield {
+                                        "type":
+                                        "tool",
+                                        "name":
+                                        convert_mcp_name(message_chunk.name,
+                                                         mcp_names),
+                                        "id":
+                                        message_chunk.tool_call_id,
+                                        "content":
+                                        message_chunk.content
+                                    }
+                                elif hasattr(message_chunk,
+                                             'tool_call_chunks') and len(
+                                                 message_chunk.tool_call_chunks) > 0:
+                                    for tool_call_chunk in message_chunk.tool_call_chunks:
+                                        if dispatcher is not None:
+                                            dispatcher.feed(tool_call_chunk)
+                                        yield {
+                                            "type":
+                                            "tool_call_chunks",
+                                            "name":
+                                            convert_mcp_name(tool_call_chunk["name"],
+                                                             mcp_names),
+                                            "id":
+                                            tool_call_chunk.get("id"),
+                                            "content":
+                                            tool_call_chunk["args"],
+                                            "next_tool":
+                                            bool(use_tool and tool_call_chunk["name"])
+                                        }
+                                        if tool_call_chunk["name"]:
+                                            use_tool = True
+                                elif message_chunk.content:
+                                    yield {
+                                        "type": "content",
+                                        "content": message_chunk.content
+                                    }
+                        elif step[0] == "values":
+                            langchain_messages = step[1]["messages"]
+                            last_message = langchain_messages[-1]
+                            if isinstance(last_message, AIMessage
+                                          ) and last_message.tool_calls:
+                                tools_started = time.monotonic()
+                            elif isinstance(
+                                    last_message,
+                                    ToolMessage) and tools_started is not None:
+                                trace.record("tools",
+                                             time.monotonic() - tools_started)
+                                tools_started = None
+                                llm_started = time.monotonic()
+                            # 模型通过 search_tools 扩大了工具范围，带着当前状态用新的工具集重启 Agent
+                            if selection is not None and selection.widened:
+                                selection.widened = False
+                                widened = True
+                                break
+            if not widened:
+                break
+        if usage:
+            yield {"type": "stats", "usage": usage}
@@ -0,0 +1,369 @@
+import anyio
+import asyncio
+import httpx
+import itertools
+import json
+import time
+from contextlib import asynccontextmanager
+from exceptiongroup import BaseExceptionGroup
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, ToolListChangedNotification
+from env import mcp_pool_idle_timeout, mcp_pool_health_check_interval, mcp_pool_close_timeout, mcp_tool_list_ttl, mcp_server_max_concurrency, mcp_stdio_pool_size, mcp_stdio_idle_timeout, mcp_connect_timeout, mcp_circuit_breaker_cooldown, mcp_circuit_breaker_max_cooldown
+
+
+def server_key(server: dict) -> str:
+    return json.dumps(server, sort_keys=True, ensure_ascii=False)
+
+
+def is_transport_error(e: BaseException) -> bool:
+    if isinstance(e, McpError):
+        return e.error.code == CONNECTION_CLOSED
+    return isinstance(e, (anyio.ClosedResourceError, anyio.BrokenResourceError,
+                          anyio.EndOfStream, ConnectionError,
+                          httpx.TransportError))
+
+
+def error_message(e: BaseException) -> str:
+    while isinstance(e, BaseExceptionGroup) and e.exceptions:
+        e = e.exceptions[0]
+    return str(e) or type(e).__name__
+
+
+class McpServerUnavailable(Exception):
+    pass
+
+
+# 会话对象的全局编号，连接池回收后重建的会话不会与旧会话的版本号重复
+_session_ids = itertools.count()
+
+
+class PooledMcpSession:
+
+    def __init__(self, key: str, connection: dict, replica: int = 0):
+        self.key = key
+        self.connection = connection
+        self.session_id = next(_session_ids)
+        self.replica = replica
+        self.session = None
+        self.tools = []
+        self.tools_version = 0
+        self.tools_loaded_at = 0.0
+        self.tools_stale = False
+        self.leases = 0
+        self.generation = 0
+        self.last_used = time.monotonic()
+        self.last_checked = 0.0
+        self.broken = False
+        # shared by every turn that leases this server
+        self.semaphore = asyncio.Semaphore(
+            int(connection.get("maxConcurrency", mcp_server_max_concurrency)))
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._closing = None
+
+    @property
+    def alive(self):
+        return (self.session is not None and not self.broken
+                and self._task is not None and not self._task.done())
+
+    @property
+    def version(self):
+        return self.session_id, self.generation, self.tools_version
+
+    async def _handle_message(self, message):
+        if isinstance(message, Exception):
+            self.broken = True
+        elif isinstance(getattr(message, "root", message),
+                        ToolListChangedNotification):
+            self.tools_stale = True
+
+    async def _run(self, ready: asyncio.Future, closing: asyncio.Event,
+                   generation: int):
+        # MCP transports use anyio cancel scopes, which must be entered and
+        # exited by the same task, so every connection lives in its own task.
+        connection = {
+            **self.connection, "session_kwargs": {
+                **(self.connection.get("session_kwargs") or {}), "message_handler":
+                self._handle_message
+            }
+        }
+        try:
+            async with MultiServerMCPClient({"server": connection}) as client:
+                self.session = client.sessions["server"]
+                self.tools = client.server_name_to_tools["server"]
+                self.tools_version += 1
+                self.tools_loaded_at = time.monotonic()
+                self.tools_stale = False
+                ready.set_result(None)
+                await closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                print('MCP session closed: ', e)
+        finally:
+            if self.generation == generation:
+                self.session = None
+                self.broken = True
+
+    async def _connect(self):
+        await self._close()
+        self.generation += 1
+        self.broken = False
+        ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(
+            self._run(ready, self._closing, self.generation))
+        try:
+            await ready
+        except BaseException:
+            # 连接超时或被取消时不留下仍在握手的进程
+            self._task.cancel()
+            raise
+        self.last_checked = time.monotonic()
+
+    async def _close(self):
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(task, mcp_pool_close_timeout)
+        except (asyncio.TimeoutError, Exception):
+            task.cancel()
+
+    async def _healthy(self):
+        if not self.alive:
+            return False
+        if time.monotonic() - self.last_checked < mcp_pool_health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(self.session.send_ping(),
+                                   mcp_pool_health_check_interval)
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    async def _refresh_tools(self):
+        self.tools_stale = False
+        try:
+            self.tools = await load_mcp_tools(self.session)
+        except BaseException:
+            self.tools_stale = True
+            raise
+        self.tools_version += 1
+        self.tools_loaded_at = time.monotonic()
+
+    async def ensure_connected(self):
+        async with self._lock:
+            if not await self._healthy():
+                await self._connect()
+            elif self.tools_stale or time.monotonic(
+            ) - self.tools_loaded_at > mcp_tool_list_ttl:
+                await self._refresh_tools()
+
+    def report_error(self, e: BaseException):
+        if is_transport_error(e):
+            self.broken = True
+
+    def release(self):
+        self.leases -= 1
+        self.last_used = time.monotonic()
+
+    async def close(self):
+        async with self._lock:
+            await self._close()
+
+
+class PooledMcpClient:
+
+    def __init__(self, entries: dict, unavailable: dict = None):
+        self.entries = entries
+        # servers that failed to connect within their deadline this turn
+        self.unavailable = unavailable or {}
+        self.sessions = {
+            name: entry.session
+            for name, entry in entries.items()
+        }
+        self.server_name_to_tools = {
+            name: entry.tools
+            for name, entry in entries.items()
+        }
+
+
+class McpServerGroup:
+    # stdio servers are kept warm as a bounded set of supervised processes,
+    # every other transport is a single shared connection
+
+    def __init__(self, key: str, connection: dict):
+        self.key = key
+        self.connection = connection
+        self.supervised = connection.get("transport") == "stdio"
+        size = 1
+        if self.supervised:
+            size = max(1, int(connection.get("poolSize",
+                                             mcp_stdio_pool_size)))
+        self.replicas = [
+            PooledMcpSession(key, connection, replica)
+            for replica in range(size)
+        ]
+        self.connect_timeout = float(
+            connection.get("connectTimeout", mcp_connect_timeout))
+        # 熔断：连续连接失败后的一段时间内直接跳过该 Server，冷却时间逐次翻倍
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def leases(self):
+        return sum(replica.leases for replica in self.replicas)
+
+    @property
+    def last_used(self):
+        return max(replica.last_used for replica in self.replicas)
+
+    async def connect(self, replica: PooledMcpSession):
+        # 所有连接都有超时，失败计入熔断
+        try:
+            await asyncio.wait_for(replica.ensure_connected(),
+                                   self.connect_timeout)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            self.failures += 1
+            self.open_until = time.monotonic() + min(
+                mcp_circuit_breaker_cooldown * 2**(self.failures - 1),
+                mcp_circuit_breaker_max_cooldown)
+            if isinstance(e, asyncio.TimeoutError):
+                raise McpServerUnavailable(
+                    f"连接超时（{self.connect_timeout:g} 秒）") from e
+            raise
+        self.failures = 0
+        self.open_until = 0.0
+
+    async def lease(self) -> PooledMcpSession:
+        remaining = self.open_until - time.monotonic()
+        if remaining > 0:
+            raise McpServerUnavailable(
+                f"连接失败次数过多，{int(remaining) + 1} 秒后重试")
+        replicas = [replica for replica in self.replicas
+                    if replica.alive] or self.replicas
+        replica = min(replicas, key=lambda replica: replica.leases)
+        replica.leases += 1
+        try:
+            await self.connect(replica)
+        except BaseException:
+            replica.release()
+            raise
+        return replica
+
+    async def supervise(self):
+        # health-check idle replicas and restart the ones that died
+        if self.open_until > time.monotonic():
+            return
+        results = await asyncio.gather(*[
+            self.connect(replica)
+            for replica in self.replicas if replica.leases <= 0
+        ],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print('MCP server restart failed: ', error_message(result))
+
+    async def close(self):
+        await asyncio.gather(*[replica.close() for replica in self.replicas])
+
+
+class McpSessionPool:
+
+    def __init__(self, idle_timeout: float, stdio_idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self.stdio_idle_timeout = stdio_idle_timeout
+        self._groups: dict[str, McpServerGroup] = {}
+        self._supervisor = None
+
+    def _start_supervisor(self):
+        if self._supervisor is None or self._supervisor.done():
+            self._supervisor = asyncio.create_task(self._supervise())
+
+    async def _supervise(self):
+        while self._groups:
+            await asyncio.sleep(
+                max(min(self.idle_timeout / 4, mcp_pool_health_check_interval),
+                    1))
+            now = time.monotonic()
+            supervised = []
+            for key, group in list(self._groups.items()):
+                idle_timeout = self.stdio_idle_timeout if group.supervised else self.idle_timeout
+                if group.leases <= 0 and now - group.last_used > idle_timeout:
+                    del self._groups[key]
+                    await group.close()
+                elif group.supervised:
+                    supervised.append(group)
+            await asyncio.gather(*[group.supervise() for group in supervised])
+
+    def _group(self, connection: dict) -> McpServerGroup:
+        key = server_key(connection)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = McpServerGroup(key, connection)
+        return group
+
+    async def prespawn(self, mcp_servers: dict):
+        groups = [
+            self._group(connection) for connection in mcp_servers.values()
+        ]
+        self._start_supervisor()
+        results = await asyncio.gather(*[
+            group.connect(replica) for group in groups
+            for replica in group.replicas
+        ],
+                                       return_exceptions=True)
+        return [result for result in results if isinstance(result, Exception)]
+
+    @asynccontextmanager
+    async def connect(self, mcp_servers: dict, allow_partial: bool = False):
+        # allow_partial: 部分 Server 连接失败时仍然返回可用的子集
+        names = list(mcp_servers.keys())
+        leases = [
+            asyncio.ensure_future(self._group(mcp_servers[name]).lease())
+            for name in names
+        ]
+        try:
+            results = await asyncio.gather(*leases, return_exceptions=True)
+        except asyncio.CancelledError:
+            # the turn was cancelled while connecting, hand back the leases
+            # that were already granted
+            for lease in leases:
+                if lease.done() and not lease.cancelled(
+                ) and lease.exception() is None:
+                    lease.result().release()
+            raise
+        self._start_supervisor()
+        entries = {
+            name: result
+            for name, result in zip(names, results)
+            if isinstance(result, PooledMcpSession)
+        }
+        errors = {
+            name: result
+            for name, result in zip(names, results)
+            if isinstance(result, BaseException)
+        }
+        try:
+            if errors and not allow_partial:
+                raise next(iter(errors.values()))
+            yield PooledMcpClient(entries, unavailable=errors)
+        finally:
+            for entry in entries.values():
+                entry.release()
+
+    async def close(self):
+        groups, self._groups = self._groups, {}
+        await asyncio.gather(*[group.close() for group in groups.values()])
+
+
+mcp_session_pool = McpSessionPool(idle_timeout=mcp_pool_idle_timeout,
+                                  stdio_idle_timeout=mcp_stdio_idle_timeout)
@@ -0,0 +1,207 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 120, 300)
+
+queue_join_header = "x-queue-join-time"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, **extra) -> str:
+    labels = [
+        f'{name}="{_escape(value)}"'
+        for name, value in [*zip(names, values), *extra.items()]
+    ]
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Histogram:
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labels: tuple = (),
+                 buckets: tuple = default_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram"
+        ]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le=bound)} {bucket_count}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.labels, key, le='+Inf')} {count}"
+            )
+            lines.append(
+                f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(
+                f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = defaultdict(float)
+
+    def inc(self, value: float = 1, **labels):
+        self._series[tuple(labels.get(name, "") for name in self.labels)] += value
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter"
+        ]
+        for key, value in sorted(self._series.items()):
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+
+    def set(self, value: float, **labels):
+        self._series[tuple(labels.get(name, "") for name in self.labels)] = value
+
+    def render(self) -> list:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, documentation: str, labels: tuple = ()):
+        metric = Histogram(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()):
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()):
+        metric = Gauge(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+turn_seconds = metrics.histogram("mcp_playground_turn_seconds",
+                                 "Total duration of a chat turn.",
+                                 ("status", ))
+phase_seconds = metrics.histogram(
+    "mcp_playground_phase_seconds",
+    "Duration of each phase of a chat turn.", ("phase", ))
+tool_call_seconds = metrics.histogram("mcp_playground_tool_call_seconds",
+                                      "Duration of a single MCP tool call.",
+                                      ("server", "tool", "status"))
+
+
+class TurnTrace:
+    # 记录一轮对话中各阶段的耗时，同时汇总到 Prometheus 直方图
+
+    def __init__(self, queue_wait: float = None):
+        self.started_at = time.monotonic()
+        self.spans = defaultdict(float)
+        self.counts = defaultdict(int)
+        if queue_wait is not None:
+            self.record("queue_wait", queue_wait)
+
+    def record(self, phase: str, seconds: float):
+        self.spans[phase] += seconds
+        self.counts[phase] += 1
+        phase_seconds.observe(seconds, phase=phase)
+
+    @contextmanager
+    def span(self, phase: str):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, time.monotonic() - started_at)
+
+    def finish(self, status: str = "ok"):
+        self.spans["total"] = time.monotonic() - self.started_at
+        turn_seconds.observe(self.spans["total"], status=status)
+
+    def footer(self) -> str:
+        parts = []
+        for phase, label in (("queue_wait", "排队"), ("mcp_connect", "连接"),
+                             ("llm_first_token", "首字"), ("tools", "工具"),
+                             ("total", "总计")):
+            if phase not in self.spans:
+                continue
+            part = f"{label} {self.spans[phase]:.1f}s"
+            if self.counts[phase] > 1:
+                part += f" ×{self.counts[phase]}"
+            parts.append(part)
+        return " · ".join(parts)
+
+
+class QueueTimingMiddleware:
+    # 在进入 Gradio 队列时打上时间戳，事件开始执行时据此计算排队时间
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/queue/join"):
+            # 丢弃客户端自带的同名请求头，避免伪造排队时间
+            scope = {
+                **scope, "headers": [
+                    *[(name, value) for name, value in scope["headers"]
+                      if name.lower() != queue_join_header.encode()],
+                    (queue_join_header.encode(), str(time.time()).encode())
+                ]
+            }
+        await self.app(scope, receive, send)
+
+
+def queue_wait_seconds(request) -> float:
+    value = request.headers.get(queue_join_header) if request else None
+    if not value:
+        return None
+    try:
+        return max(0.0, time.time() - float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,350 @@
+import argparse
+import hmac
+import json
+import math
+import time
+import uuid
+import uvicorn
+from contextlib import aclosing, asynccontextmanager
+from exceptiongroup import ExceptionGroup
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from config import default_mcp_servers, default_sys_prompt, model_options
+from context_manager import context_budget_for
+from env import headless_api_key, internal_mcp_config, server_name, server_port
+from llm_pool import get_chat_model
+from mcp_client import generate_with_mcp, merge_mcp_config
+from metrics import TurnTrace
+from routes import router as routes_router
+from scheduler import BackendOverloaded, scheduler
+from tool_output import tool_output_text
+from warmup import start_warm_up
+
+# 兼容 OpenAI chat completions 的接口，直接输出 generate_with_mcp 的事件，不经过 Gradio 界面
+# 扩展字段：mcp_config 与界面中的 MCP 配置格式相同（不支持 stdio），mcp_servers 为启用的 Server 名称，省略时与界面默认启用的一致
+
+router = APIRouter(prefix="/v1")
+
+
+def message_text(content) -> str:
+    if isinstance(content, list):
+        return "".join(
+            item.get("text", "") for item in content
+            if isinstance(item, dict) and item.get("type") == "text")
+    return str(content or "")
+
+
+class InvalidRequest(Exception):
+    pass
+
+
+def parse_request(body: dict):
+    if not isinstance(body, dict):
+        raise InvalidRequest("request body must be a JSON object")
+    model = body.get("model")
+    messages = body.get("messages")
+    if not model or not isinstance(messages, list) or not messages:
+        raise InvalidRequest("model and messages are required")
+    if model not in {option["value"] for option in model_options}:
+        raise InvalidRequest(f"model {model} is not available")
+    sys_prompts = []
+    history = []
+    for message in messages:
+        if not isinstance(message, dict):
+            raise InvalidRequest("each message must be an object")
+        role = message.get("role")
+        if role in ("system", "developer"):
+            sys_prompts.append(message_text(message.get("content")))
+        elif role in ("user", "assistant"):
+            history.append({
+                "role": role,
+                "content": message_text(message.get("content"))
+            })
+    if not history or history[-1]["role"] != "user":
+        raise InvalidRequest("the last message must be from the user")
+    mcp_config = body.get("mcp_config") or {}
+    if isinstance(mcp_config, str):
+        try:
+            mcp_config = json.loads(mcp_config)
+        except ValueError:
+            raise InvalidRequest("mcp_config is not valid JSON")
+    if not isinstance(mcp_config, dict) or not isinstance(
+            mcp_config.get("mcpServers", {}), dict):
+        raise InvalidRequest("mcp_config must be an object with mcpServers")
+    # 请求中的 stdio Server 会在本机启动进程，直接拒绝
+    for server_name, server in mcp_config.get("mcpServers", {}).items():
+        if not isinstance(server, dict):
+            raise InvalidRequest(f"MCP server {server_name} must be an object")
+        if server.get("type") == "stdio" or "command" in server:
+            raise InvalidRequest(
+                f"stdio MCP server {server_name} is not allowed")
+    enabled_mcp_servers = body.get("mcp_servers")
+    if enabled_mcp_servers is None:
+        # 与界面默认启用的 Server 一致：请求中配置的 Server 加上默认 Server
+        enabled_mcp_servers = [
+            *mcp_config.get("mcpServers", {}).keys(), *[
+                server["name"]
+                for server in default_mcp_servers if server.get("enabled")
+            ]
+        ]
+    elif not isinstance(enabled_mcp_servers, list) or not all(
+            isinstance(name, str) for name in enabled_mcp_servers):
+        raise InvalidRequest("mcp_servers must be a list of server names")
+    return {
+        "model": model,
+        "messages": history,
+        "sys_prompt": "\n\n".join(sys_prompts) or default_sys_prompt,
+        "mcp_config": merge_mcp_config(mcp_config, internal_mcp_config),
+        "enabled_mcp_servers": enabled_mcp_servers
+    }
+
+
+def authorize(request: Request):
+    # 未配置 HEADLESS_API_KEY 时接口不可用
+    if not headless_api_key or not hmac.compare_digest(
+            request.headers.get("authorization", "").encode(),
+            f"Bearer {headless_api_key}".encode()):
+        raise HTTPException(status_code=401, detail="invalid api key")
+
+
+def openai_usage(usage: dict):
+    if not usage:
+        return None
+    return {
+        "prompt_tokens": usage.get("input_tokens", 0),
+        "completion_tokens": usage.get("output_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0)
+    }
+
+
+async def completion_events(params: dict, user: str):
+    # 按模型端点排队后运行一轮对话，与界面共用调度器、连接池和各类缓存
+    trace = TurnTrace()
+    status = "error"
+    try:
+        async with scheduler.slot(params["model"], user=user, trace=trace):
+            async with aclosing(
+                    generate_with_mcp(
+                        params["messages"],
+                        mcp_config=params["mcp_config"],
+                        enabled_mcp_servers=params["enabled_mcp_servers"],
+                        sys_prompt=params["sys_prompt"],
+                        get_llm=lambda: get_chat_model(params["model"]),
+                        context_budget=context_budget_for(params["model"]),
+                        trace=trace)) as events:
+                async for event in events:
+                    yield event
+        status = "ok"
+    finally:
+        trace.finish(status)
+
+
+def chunk_data(completion_id: str, model: str, created: int, delta: dict,
+               finish_reason=None, **extra):
+    return "data: " + json.dumps(
+        {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason
+            }] if delta is not None else [],
+            **extra
+        },
+        ensure_ascii=False) + "\n\n"
+
+
+async def stream_completion(params: dict, user: str, include_usage: bool):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = params["model"]
+    usage = None
+    yield chunk_data(completion_id, model, created, {
+        "role": "assistant",
+        "content": ""
+    })
+    try:
+        async with aclosing(completion_events(params, user)) as events:
+            async for event in events:
+                if event["type"] == "content":
+                    yield chunk_data(completion_id, model, created,
+                                     {"content": event["content"]})
+                elif event["type"] == "tool_call_chunks":
+                    # 工具已在服务端执行，使用扩展字段，避免客户端把它当作需要自己执行的 tool_calls
+                    yield chunk_data(
+                        completion_id, model, created, {
+                            "mcp_tool_call": {
+                                "id": event["id"],
+                                "name": event["name"],
+                                "arguments": event["content"]
+                            }
+                        })
+                elif event["type"] == "tool":
+                    yield chunk_data(
+                        completion_id, model, created, {
+                            "mcp_tool_result": {
+                                "id": event["id"],
+                                "name": event["name"],
+                                "content": tool_output_text(event["content"])
+                            }
+                        })
+                elif event["type"] == "stats" and event.get("unavailable"):
+                    yield chunk_data(completion_id,
+                                     model,
+                                     created,
+                                     None,
+                                     mcp_unavailable=event["unavailable"])
+                elif event["type"] == "stats" and event.get("usage"):
+                    usage = openai_usage(event["usage"])
+    except ExceptionGroup as eg:
+        print('Error: ', eg.exceptions[0])
+        yield chunk_data(completion_id,
+                         model,
+                         created,
+                         None,
+                         error={"message": str(eg.exceptions[0])})
+    except Exception as e:
+        print('Error: ', e)
+        yield chunk_data(completion_id,
+                         model,
+                         created,
+                         None,
+                         error={"message": str(e)})
+    yield chunk_data(completion_id, model, created, {}, "stop")
+    if include_usage:
+        yield chunk_data(completion_id, model, created, None, usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+async def complete(params: dict, user: str):
+    content = ""
+    tool_calls = []
+    unavailable = None
+    usage = None
+    try:
+        async with aclosing(completion_events(params, user)) as events:
+            async for event in events:
+                if event["type"] == "content":
+                    content += event["content"]
+                elif event["type"] == "tool_call_chunks":
+                    if event["name"]:
+                        tool_calls.append({
+                            "id": event["id"],
+                            "name": event["name"],
+                            "arguments": ""
+                        })
+                    if tool_calls:
+                        tool_calls[-1]["arguments"] += event["content"] or ""
+                elif event["type"] == "tool":
+                    for call in tool_calls:
+                        if call["id"] == event["id"]:
+                            call["result"] = tool_output_text(event["content"])
+                elif event["type"] == "stats" and event.get("unavailable"):
+                    unavailable = event["unavailable"]
+                elif event["type"] == "stats" and event.get("usage"):
+                    usage = openai_usage(event["usage"])
+    except BackendOverloaded:
+        raise
+    except ExceptionGroup as eg:
+        print('Error: ', eg.exceptions[0])
+        raise HTTPException(status_code=502, detail=str(eg.exceptions[0]))
+    except Exception as e:
+        print('Error: ', e)
+        raise HTTPException(status_code=502, detail=str(e))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": params["model"],
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": content
+            },
+            "finish_reason": "stop"
+        }],
+        "usage": usage,
+        "mcp_tool_calls": tool_calls,
+        "mcp_unavailable": unavailable
+    }
+
+
+def invalid_request(e: InvalidRequest):
+    return JSONResponse(
+        {"error": {
+            "message": str(e),
+            "type": "invalid_request_error"
+        }},
+        status_code=400)
+
+
+def overloaded(e: BackendOverloaded):
+    return JSONResponse({"error": {
+        "message": str(e)
+    }},
+                        status_code=429,
+                        headers={"Retry-After": str(math.ceil(e.estimated_wait) or 1)})
+
+
+@router.post("/chat/completions")
+async def chat_completions(request: Request):
+    authorize(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        return invalid_request(InvalidRequest("invalid JSON body"))
+    try:
+        params = parse_request(body)
+    except InvalidRequest as e:
+        return invalid_request(e)
+    user = body.get("user") or (request.client.host
+                                if request.client else None)
+    # 排队已满时在返回流之前拒绝，客户端可以据此重试
+    try:
+        scheduler.backend(params["model"]).check()
+    except BackendOverloaded as e:
+        return overloaded(e)
+    if body.get("stream"):
+        return StreamingResponse(
+            stream_completion(
+                params, user,
+                bool((body.get("stream_options") or {}).get("include_usage"))),
+            media_type="text/event-stream")
+    try:
+        return await complete(params, user)
+    except BackendOverloaded as e:
+        return overloaded(e)
+
+
+@router.get("/models")
+def list_models(request: Request):
+    authorize(request)
+    return {
+        "object": "list",
+        "data": [{
+            "id": option["value"],
+            "object": "model"
+        } for option in model_options]
+    }
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_warm_up()
+    yield
+
+
+if __name__ == "__main__":
+    # 独立运行，不加载 Gradio 界面，例如: python openai_api.py --port 8000
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=server_name)
+    parser.add_argument("--port", type=int, default=server_port)
+    args = parser.parse_args()
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.include_router(routes_router)
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from env import mcp_prompt_cache_dir, mcp_prompt_cache_ttl, mcp_prompt_cache_size
+
+
+def prompt_cache_key(tool_descriptions: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(tool_descriptions, sort_keys=True,
+                   ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+
+    def __init__(self, cache_dir: str, ttl: float, max_size: int):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self._memory: OrderedDict[str, tuple] = OrderedDict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def _load(self, key: str):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["created_at"], entry["examples"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get(self, key: str):
+        entry = self._memory.get(key) or self._load(key)
+        if entry is None:
+            return None
+        if self._expired(entry[0]):
+            self._memory.pop(key, None)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+        return entry[1]
+
+    def set(self, key: str, examples: list):
+        entry = (time.time(), examples)
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "created_at": entry[0],
+                    "examples": examples
+                },
+                          f,
+                          ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+            self.evict()
+        except OSError as e:
+            print('Prompt cache write failed: ', e)
+
+    def evict(self):
+        try:
+            files = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if name.endswith(".json")
+            ]
+        except OSError:
+            return
+        files.sort(key=lambda path: os.path.getmtime(path), reverse=True)
+        now = time.time()
+        for i, path in enumerate(files):
+            if i >= self.max_size or now - os.path.getmtime(path) > self.ttl:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+prompt_cache = PromptCache(cache_dir=mcp_prompt_cache_dir,
+                           ttl=mcp_prompt_cache_ttl,
+                           max_size=mcp_prompt_cache_size)
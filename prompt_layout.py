@@ -0,0 +1,85 @@
+import hashlib
+import json
+from collections import OrderedDict
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from env import prefix_tracker_size
+
+
+def server_alias(mcp_name: str, server_key: str) -> str:
+    # 由服务名和配置内容决定，不随启用顺序变化
+    return hashlib.sha256(
+        f"{mcp_name}\n{server_key}".encode("utf-8")).hexdigest()[:8]
+
+
+def canonical_schema(schema):
+    if isinstance(schema, dict):
+        return {
+            key: canonical_schema(schema[key])
+            for key in sorted(schema.keys())
+        }
+    if isinstance(schema, list):
+        return [canonical_schema(item) for item in schema]
+    return schema
+
+
+def canonical_sys_prompt(sys_prompt: str) -> str:
+    lines = (sys_prompt or "").replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def common_prefix_length(a: bytes, b: bytes) -> int:
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class PrefixTracker:
+    # Reports how many leading bytes of a request match the previous request
+    # sent under the same key (model endpoint and session).
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._static: OrderedDict[tuple, bytes] = OrderedDict()
+        self._last: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def _remember(self, cache: OrderedDict, key: tuple, value: bytes):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    def _static_prefix(self, tools_key: tuple, tools: list,
+                       sys_prompt: str) -> bytes:
+        key = (tools_key, sys_prompt)
+        static = self._static.get(key)
+        if static is None:
+            static = json.dumps(
+                {
+                    "system": sys_prompt,
+                    "tools": [convert_to_openai_tool(tool) for tool in tools]
+                },
+                ensure_ascii=False,
+                sort_keys=True).encode("utf-8")
+        self._remember(self._static, key, static)
+        return static
+
+    def observe(self, key: tuple, tools_key: tuple, tools: list,
+                sys_prompt: str, messages: list) -> dict:
+        data = self._static_prefix(tools_key, tools,
+                                   sys_prompt) + json.dumps(
+                                       [[message.type, message.content]
+                                        for message in messages],
+                                       ensure_ascii=False).encode("utf-8")
+        previous = self._last.get(key)
+        stable_bytes = common_prefix_length(previous,
+                                            data) if previous else 0
+        self._remember(self._last, key, data)
+        return {"stable_bytes": stable_bytes, "total_bytes": len(data)}
+
+
+prefix_tracker = PrefixTracker(max_size=prefix_tracker_size)
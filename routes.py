@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from blob_store import blob_store
+from metrics import metrics
+from warmup import warmup_state
+
+router = APIRouter()
+
+
+@router.get("/tool_outputs/{blob_id}", response_class=PlainTextResponse)
+def get_tool_output(blob_id: str):
+    text = blob_store.get(blob_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="工具输出不存在或已过期")
+    return text
+
+
+@router.get("/readyz")
+def readyz():
+    # 预热完成前返回 503，供负载均衡器判断是否可以转发流量
+    return JSONResponse(warmup_state.status(),
+                        status_code=200 if warmup_state.ready else 503)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(),
+                             media_type="text/plain; version=0.0.4")
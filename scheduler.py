@@ -0,0 +1,189 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from config import backend_limits, model_options
+from env import llm_base_url, scheduler_local_max_concurrency, scheduler_local_rate_limit, scheduler_remote_max_concurrency, scheduler_remote_rate_limit, scheduler_max_queue, scheduler_max_wait
+from llm_pool import resolve_model
+from metrics import metrics
+
+scheduler_queue_depth = metrics.gauge("mcp_playground_scheduler_queue_depth",
+                                      "Turns waiting for a backend slot.",
+                                      ("backend", ))
+scheduler_active = metrics.gauge("mcp_playground_scheduler_active",
+                                 "Turns currently holding a backend slot.",
+                                 ("backend", ))
+scheduler_wait_seconds = metrics.histogram(
+    "mcp_playground_scheduler_wait_seconds",
+    "Time a turn waited for a backend slot.", ("backend", ))
+scheduler_shed_total = metrics.counter(
+    "mcp_playground_scheduler_shed_total",
+    "Turns rejected because the backend was saturated.", ("backend", ))
+
+
+class BackendOverloaded(Exception):
+
+    def __init__(self, backend: str, estimated_wait: float):
+        self.backend = backend
+        self.estimated_wait = estimated_wait
+        message = "当前模型排队人数较多"
+        if estimated_wait > 0:
+            message += f"，预计需要等待约 {math.ceil(estimated_wait)} 秒"
+        super().__init__(message + "，请稍后重试或切换其他模型")
+
+
+class Backend:
+    # 单个模型端点的并发与速率限制，排队的请求按用户轮询出队
+
+    def __init__(self, name: str, max_concurrency: int, rate_limit: float,
+                 max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        # 每分钟允许开始的请求数，0 表示不限制
+        self.min_interval = 60 / rate_limit if rate_limit > 0 else 0
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.service_time = None
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self._next_start = 0.0
+        self._timer = None
+
+    @property
+    def queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def estimate_wait(self, position: int) -> float:
+        # position 个请求排在前面时的预计等待时间
+        wait = 0.0
+        if self.service_time is not None:
+            wait = math.ceil(
+                (position + 1) / self.max_concurrency) * self.service_time
+        if self.min_interval:
+            wait = max(
+                wait, position * self.min_interval + self._next_start -
+                time.monotonic())
+        return wait
+
+    def _update_metrics(self):
+        scheduler_queue_depth.set(self.queued, backend=self.name)
+        scheduler_active.set(self.active, backend=self.name)
+
+    def _dispatch(self):
+        self._timer = None
+        while self._queues and self.active < self.max_concurrency:
+            delay = self._next_start - time.monotonic()
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(
+                    delay, self._dispatch)
+                break
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self.active += 1
+            self._next_start = time.monotonic() + self.min_interval
+        self._update_metrics()
+
+    def _remove(self, user: str, waiter: asyncio.Future):
+        queue = self._queues.get(user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[user]
+        self._update_metrics()
+
+    def check(self):
+        # 排队已满或预计等待过久时直接拒绝
+        position = self.queued
+        if self.active >= self.max_concurrency or position:
+            estimated_wait = self.estimate_wait(position)
+            if position >= self.max_queue or (self.max_wait and estimated_wait
+                                              > self.max_wait):
+                scheduler_shed_total.inc(backend=self.name)
+                raise BackendOverloaded(self.name, estimated_wait)
+
+    async def acquire(self, user: str):
+        self.check()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)
+            else:
+                self._remove(user, waiter)
+            raise
+
+    def release(self, service_time: float):
+        self.active -= 1
+        if service_time is not None:
+            # exponential moving average of how long a turn holds a slot
+            if self.service_time is None:
+                self.service_time = service_time
+            else:
+                self.service_time = 0.8 * self.service_time + 0.2 * service_time
+        if self._timer is None:
+            self._dispatch()
+        else:
+            self._update_metrics()
+
+
+class Scheduler:
+
+    def __init__(self):
+        self._backends: dict[tuple, Backend] = {}
+        self._models = {option["value"] for option in model_options}
+
+    def backend(self, model: str) -> Backend:
+        # 只接受界面中列出的模型，避免任意模型名不断创建新的 Backend
+        if model not in self._models:
+            raise ValueError(f"unknown model: {model}")
+        llm_model, base_url, _ = resolve_model(model)
+        key = (llm_model, base_url)
+        backend = self._backends.get(key)
+        if backend is None:
+            local = base_url == llm_base_url
+            name = f"{'local' if local else 'remote'}/{llm_model}"
+            limits = {
+                "max_concurrency":
+                scheduler_local_max_concurrency
+                if local else scheduler_remote_max_concurrency,
+                "rate_limit":
+                scheduler_local_rate_limit
+                if local else scheduler_remote_rate_limit,
+                "max_queue":
+                scheduler_max_queue,
+                "max_wait":
+                scheduler_max_wait,
+                **backend_limits.get(name, {})
+            }
+            backend = self._backends[key] = Backend(name, **limits)
+        return backend
+
+    @asynccontextmanager
+    async def slot(self, model: str, user: str, trace=None):
+        backend = self.backend(model)
+        started_at = time.monotonic()
+        await backend.acquire(user or "anonymous")
+        acquired_at = time.monotonic()
+        scheduler_wait_seconds.observe(acquired_at - started_at,
+                                       backend=backend.name)
+        if trace is not None:
+            trace.record("scheduler_wait", acquired_at - started_at)
+        try:
+            yield backend
+        finally:
+            backend.release(time.monotonic() - acquired_at)
+
+
+scheduler = Scheduler()
@@ -0,0 +1,201 @@
+import asyncio
+import time
+from typing import AsyncIterator, Callable
+
+_stream_end = object()
+
+
+def chunk_size(chunk: dict) -> int:
+    content = chunk.get("content")
+    if isinstance(content, str):
+        return len(content)
+    return len(str(content or ""))
+
+
+async def coalesce_frames(stream: AsyncIterator,
+                          max_fps: float,
+                          max_pending_chars: int,
+                          is_boundary: Callable = None,
+                          on_cancel: Callable = None):
+    # The source stream is drained by its own task, so it keeps a single
+    # task context and a frame can be flushed while no chunk is arriving.
+    interval = 1 / max_fps if max_fps > 0 else 0
+    queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for chunk in stream:
+                queue.put_nowait(chunk)
+            queue.put_nowait(_stream_end)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            queue.put_nowait(e)
+
+    producer = asyncio.create_task(produce())
+    getter = None
+    frame = []
+    pending_chars = 0
+    last_flush = 0.0
+    try:
+        while True:
+            timeout = None
+            if frame:
+                timeout = max(0, last_flush + interval - time.monotonic())
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                yield frame
+                frame, pending_chars, last_flush = [], 0, time.monotonic()
+                continue
+            item, getter = getter.result(), None
+            if item is _stream_end:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            frame.append(item)
+            pending_chars += chunk_size(item)
+            if (is_boundary and is_boundary(item)) or (
+                    pending_chars >= max_pending_chars
+            ) or time.monotonic() - last_flush >= interval:
+                yield frame
+                frame, pending_chars, last_flush = [], 0, time.monotonic()
+        if frame:
+            yield frame
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if not producer.done():
+            # wait for the source stream to unwind so its LLM request, tool
+            # calls and pooled sessions are released before returning
+            cancelled_at = time.monotonic()
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            if on_cancel is not None:
+                on_cancel(time.monotonic() - cancelled_at)
+
+
+class _TextBlock:
+
+    def __init__(self, entry: dict):
+        self.entry = entry
+        self.entry["type"] = "text"
+        self.text = ""
+        self.parts = []
+
+    def add(self, chunk: dict):
+        self.parts.append(chunk["content"])
+
+    def render(self):
+        # only the parts added since the last frame are joined
+        if self.parts:
+            self.text += "".join(self.parts)
+            self.parts = []
+        self.entry["content"] = self.text
+
+
+class _ToolBlock:
+    # One block can hold several parallel calls; each result is rendered
+    # right after the arguments of the call it belongs to.
+
+    def __init__(self, entry: dict):
+        self.entry = entry
+        self.entry["type"] = "tool"
+        self.entry["editable"] = False
+        self.entry["copyable"] = False
+        self.entry["options"] = {"title": "", "status": "pending"}
+        self.calls = []
+
+    def _new_call(self, chunk: dict):
+        self.calls.append({
+            "id": chunk.get("id"),
+            "name": chunk.get("name") or "",
+            "args": "",
+            "pending_args": [],
+            "result": None,
+            "link": None
+        })
+
+    def _find_call(self, chunk: dict):
+        for call in self.calls:
+            if call["result"] is None and chunk.get("id") and call[
+                    "id"] == chunk["id"]:
+                return call
+        for call in self.calls:
+            if call["result"] is None:
+                return call
+        self._new_call(chunk)
+        return self.calls[-1]
+
+    def add(self, chunk: dict):
+        if chunk["type"] == "tool":
+            call = self._find_call(chunk)
+            call["result"] = chunk["content"]
+            call["link"] = chunk.get("link")
+            return
+        if chunk["next_tool"] or not self.calls:
+            self._new_call(chunk)
+        elif chunk["name"]:
+            self.calls[-1]["name"] += chunk["name"]
+        if chunk.get("id") and not self.calls[-1]["id"]:
+            self.calls[-1]["id"] = chunk["id"]
+        if chunk["content"]:
+            self.calls[-1]["pending_args"].append(chunk["content"])
+
+    def render(self):
+        names = [call["name"] for call in self.calls if call["name"]]
+        if names:
+            self.entry["options"][
+                "title"] = f"**🔧 调用 MCP 工具** `{' '.join(names)}`"
+        if self.calls and all(call["result"] is not None
+                              for call in self.calls):
+            self.entry["options"]["status"] = "done"
+        parts = []
+        for call in self.calls:
+            if call["pending_args"]:
+                call["args"] += "".join(call["pending_args"])
+                call["pending_args"] = []
+            if parts:
+                parts.append("\n\n")
+            if len(self.calls) > 1 and call["name"]:
+                parts.append(f"`{call['name']}`\n")
+            if call["args"]:
+                parts.append(f"**📝 参数**\n```json\n{call['args']}\n```")
+            if call["result"] is not None:
+                parts.append(f'\n\n**🎯 结果**\n```\n{call["result"]}\n```')
+            if call["link"]:
+                parts.append(f"\n\n[查看完整结果]({call['link']})")
+        self.entry["content"] = "".join(parts)
+
+
+class MessageAccumulator:
+    # Chunks are kept as lists of parts and joined only in materialize(),
+    # which the caller runs once per emitted frame.
+
+    def __init__(self, content: list):
+        self.content = content
+        self._chunk_type = None
+        self._block = None
+        self._dirty = []
+
+    def add(self, chunk: dict):
+        chunk_type = chunk["type"]
+        if self._chunk_type != chunk_type and not (
+                self._chunk_type == "tool_call_chunks"
+                and chunk_type == "tool"):
+            entry = {}
+            self.content.append(entry)
+            if chunk_type == "content":
+                self._block = _TextBlock(entry)
+            else:
+                self._block = _ToolBlock(entry)
+        self._chunk_type = chunk_type
+        self._block.add(chunk)
+        if not self._dirty or self._dirty[-1] is not self._block:
+            self._dirty.append(self._block)
+
+    def materialize(self):
+        for block in self._dirty:
+            block.render()
+        self._dirty = []
@@ -0,0 +1,58 @@
+import asyncio
+from mcp_pool import McpServerGroup, McpServerUnavailable, McpSessionPool
+
+# 从不响应 initialize 的 stdio Server，例如卡住的 npx 下载
+hung_server = {
+    "transport": "stdio",
+    "command": "hung-server",
+    "args": [],
+    "poolSize": 2,
+    "connectTimeout": 0.1
+}
+
+
+async def hang():
+    await asyncio.Event().wait()
+
+
+def hung_group(connection=hung_server):
+    group = McpServerGroup("hung", connection)
+    for replica in group.replicas:
+        replica._connect = hang
+    return group
+
+
+def test_supervise_gives_up_after_connect_timeout():
+
+    async def main():
+        group = hung_group()
+        await asyncio.wait_for(group.supervise(), 1)
+        assert group.failures > 0
+        assert not any(replica._lock.locked() for replica in group.replicas)
+        # 熔断打开后直接拒绝，不再等待连接超时
+        try:
+            await asyncio.wait_for(group.lease(), 0.05)
+        except McpServerUnavailable:
+            pass
+        else:
+            raise AssertionError("lease should fail while the breaker is open")
+        assert group.leases == 0
+
+    asyncio.run(main())
+
+
+def test_prespawn_gives_up_after_connect_timeout():
+
+    async def main():
+        pool = McpSessionPool(idle_timeout=60, stdio_idle_timeout=60)
+        group = pool._group(hung_server)
+        for replica in group.replicas:
+            replica._connect = hang
+        errors = await asyncio.wait_for(pool.prespawn({"hung": hung_server}),
+                                        1)
+        assert len(errors) == len(group.replicas)
+        assert all(isinstance(e, McpServerUnavailable) for e in errors)
+        assert group.open_until > 0
+        pool._supervisor.cancel()
+
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+import app
+from config import model_options
+from conversation_store import ConversationStore
+from metrics import TurnTrace
+
+model = model_options[0]["value"]
+
+
+class RecordingTrace(TurnTrace):
+    statuses = []
+
+    def finish(self, status: str = "ok"):
+        super().finish(status)
+        self.statuses.append(status)
+
+
+async def hanging_reply(*args, **kwargs):
+    yield {"type": "content", "content": "partial"}
+    await asyncio.Event().wait()
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ConversationStore(max_size=8, ttl=3600)
+    monkeypatch.setattr(app, "conversation_store", store)
+    monkeypatch.setattr(app, "generate_with_mcp", hanging_reply)
+    monkeypatch.setattr(app, "TurnTrace", RecordingTrace)
+    RecordingTrace.statuses = []
+    return store
+
+
+def start_turn(session_id):
+    return app.submit("hi", {
+        "model": model,
+        "sys_prompt": ""
+    }, "{}", {"data_source": []}, session_id)
+
+
+def test_closing_at_yield_records_cancelled_turn(store):
+
+    async def main():
+        turn = start_turn("closed")
+        await turn.__anext__()
+        await turn.__anext__()
+        # Gradio 停止对话时，生成器停在 yield 处会收到 GeneratorExit
+        await turn.aclose()
+        conversation = store.get("closed")
+        assert RecordingTrace.statuses == ["cancelled"]
+        assert not store.busy("closed")
+        assert conversation.messages[-1]["status"] == "done"
+        assert conversation.messages[-1]["content"][0]["content"] == "partial"
+
+    asyncio.run(main())
+
+
+def test_cancelling_while_streaming_records_cancelled_turn(store):
+
+    async def main():
+        turn = start_turn("cancelled")
+        await turn.__anext__()
+        await turn.__anext__()
+        task = asyncio.ensure_future(turn.__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert RecordingTrace.statuses == ["cancelled"]
+        assert not store.busy("cancelled")
+
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import asyncio
+from tool_result_cache import ToolResultCache
+
+
+def test_coalesced_calls_share_one_request():
+
+    async def main():
+        cache = ToolResultCache(max_size=8)
+        calls = []
+
+        async def tool(**arguments):
+            calls.append(arguments)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[
+            cache.call(("server", "tool", "{}"), 60, tool, {})
+            for _ in range(3)
+        ])
+        assert results == ["result"] * 3
+        assert len(calls) == 1
+
+    asyncio.run(main())
+
+
+def test_caller_after_last_waiter_left_starts_new_flight():
+
+    async def main():
+        cache = ToolResultCache(max_size=8)
+        key = ("server", "tool", "{}")
+        started = asyncio.Event()
+
+        async def tool(**arguments):
+            started.set()
+            # 取消时仍需要一段时间才能结束，模拟关闭连接等清理工作
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.05)
+                raise
+            return "stale"
+
+        first = asyncio.create_task(cache.call(key, 60, tool, {}))
+        await started.wait()
+        first.cancel()
+        await asyncio.sleep(0)
+        assert first.cancelled()
+
+        async def fresh(**arguments):
+            return "fresh"
+
+        # 上一次调用的任务还在结束过程中，新的调用不能拿到它的 CancelledError
+        assert await cache.call(key, 60, fresh, {}) == "fresh"
+        await asyncio.sleep(0.1)
+        assert await cache.call(key, 60, tool, {}) == "fresh"
+
+    asyncio.run(main())
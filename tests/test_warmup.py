@@ -0,0 +1,15 @@
+import json
+from config import default_mcp_config, default_mcp_servers
+from env import internal_mcp_config
+from mcp_client import merge_mcp_config, parse_mcp_config
+
+
+def test_default_enabled_servers_are_configured():
+    # 预热的工具目录与新页面第一轮对话启用的 Server 相同，默认配置下不能为空
+    mcp_config = merge_mcp_config(json.loads(default_mcp_config),
+                                  internal_mcp_config)
+    enabled = [
+        server["name"] for server in default_mcp_servers
+        if server.get("enabled")
+    ]
+    assert parse_mcp_config(mcp_config, enabled)
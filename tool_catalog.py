@@ -0,0 +1,125 @@
+import hashlib
+import time
+from collections import OrderedDict
+from env import internal_mcp_config, mcp_tool_catalog_size
+from metrics import tool_call_seconds
+from tool_result_cache import tool_cache_ttl, tool_result_cache
+from tool_output import bound_tool_output, read_tool_output_tool
+from prompt_layout import canonical_schema, server_alias
+from tool_retrieval import ToolIndex
+from tool_dispatch import dispatchable
+
+
+# OpenAI 兼容接口限制函数名最长 64 个字符
+max_tool_name_length = 64
+
+
+def metric_labels(mcp_name: str, tool_name: str) -> dict:
+    # 用户配置的 Server 和工具名称不可控，统一记为 other，避免指标标签无限增长；
+    # 合并配置时内置配置优先，内置 Server 的名称不会被用户配置覆盖
+    if mcp_name in internal_mcp_config.get("mcpServers", {}):
+        return {"server": mcp_name, "tool": tool_name}
+    return {"server": "other", "tool": "other"}
+
+
+def bind_session(coroutine, entry, labels: dict):
+    # 限制单个 MCP Server 的并发，并在连接断开时让连接池重连
+
+    async def call_tool(**arguments):
+        async with entry.semaphore:
+            started_at = time.monotonic()
+            status = "error"
+            try:
+                result = await coroutine(**arguments)
+                status = "ok"
+                return result
+            except Exception as e:
+                entry.report_error(e)
+                raise
+            finally:
+                tool_call_seconds.observe(time.monotonic() - started_at,
+                                          status=status,
+                                          **labels)
+
+    return call_tool
+
+
+class CatalogEntry:
+
+    def __init__(self, key: tuple, tools: list, mcp_names: dict):
+        self.key = key
+        self.tools = tools
+        self.mcp_names = mcp_names
+        self._index = None
+
+    @property
+    def index(self) -> ToolIndex:
+        # built lazily, once per catalog
+        if self._index is None:
+            self._index = ToolIndex([
+                tool for tool in self.tools
+                if tool is not read_tool_output_tool
+            ])
+        return self._index
+
+
+class ToolCatalog:
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple, CatalogEntry] = OrderedDict()
+
+    def _build(self, key: tuple, client) -> CatalogEntry:
+        tools = []
+        mcp_names = {}
+        # 按内容派生的别名排序，保证工具块的序列化结果稳定，便于推理端复用前缀缓存
+        aliased_entries = sorted(
+            (server_alias(mcp_name, entry.key), mcp_name, entry)
+            for mcp_name, entry in client.entries.items())
+        for alias, mcp_name, entry in aliased_entries:
+            mcp_names[alias] = mcp_name
+            for tool in sorted(entry.tools, key=lambda tool: tool.name):
+                new_tool = tool.model_copy()
+                # tool match ^[a-zA-Z0-9_-]+$
+                new_tool.name = f"{alias}__TOOL__{tool.name}"
+                if len(new_tool.name) > max_tool_name_length:
+                    # 名称过长时改用哈希生成的短名称，界面中显示的名称记录在 mcp_names 中
+                    new_tool.name = f"{alias}_" + hashlib.sha256(
+                        tool.name.encode("utf-8")).hexdigest()[:16]
+                    mcp_names[new_tool.name] = f"[{mcp_name}] {tool.name}"
+                if isinstance(tool.args_schema, dict):
+                    new_tool.args_schema = canonical_schema(tool.args_schema)
+                new_tool.coroutine = bind_session(
+                    tool.coroutine, entry, metric_labels(mcp_name, tool.name))
+                cache_ttl = tool_cache_ttl(entry.connection, tool.name)
+                if cache_ttl:
+                    new_tool.coroutine = tool_result_cache.wrap(
+                        new_tool.coroutine, entry.key, tool.name, cache_ttl)
+                new_tool.coroutine = bound_tool_output(new_tool.coroutine)
+                if cache_ttl:
+                    # 只有声明为可缓存（无副作用）的工具才允许在模型输出结束前提前执行
+                    new_tool.coroutine = dispatchable(new_tool.coroutine,
+                                                      new_tool.name)
+                tools.append(new_tool)
+        if tools:
+            tools.append(read_tool_output_tool)
+        return CatalogEntry(key, tools, mcp_names)
+
+    def get(self, client) -> CatalogEntry:
+        # keyed by each server's identity and tool-list version, so a
+        # reconnect or a tools/list_changed notification yields a new entry
+        key = tuple(
+            sorted((name, entry.key, entry.version)
+                   for name, entry in client.entries.items()))
+        catalog = self._entries.get(key)
+        if catalog is not None:
+            self._entries.move_to_end(key)
+            return catalog
+        catalog = self._build(key, client)
+        self._entries[key] = catalog
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return catalog
+
+
+tool_catalog = ToolCatalog(max_size=mcp_tool_catalog_size)
@@ -0,0 +1,155 @@
+import asyncio
+import json
+from collections import defaultdict, deque
+from jsonschema import ValidationError
+from jsonschema.exceptions import SchemaError
+from jsonschema.validators import validator_for
+from langchain_core.runnables.config import ensure_config
+from metrics import metrics
+from tool_result_cache import canonical_args
+
+early_dispatch_total = metrics.counter(
+    "mcp_playground_tool_early_dispatch_total",
+    "Tool calls started before the model finished its message.",
+    ("outcome", ))
+
+
+class ArgumentsParser:
+    # 增量扫描流式输出的工具参数，顶层 JSON 对象闭合时即认为参数完整
+
+    def __init__(self):
+        self.buffer = ""
+        self.complete = False
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> bool:
+        if self.complete or not text:
+            return self.complete
+        start = len(self.buffer)
+        self.buffer += text
+        for char in self.buffer[start:]:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._started = True
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._started and self._depth == 0:
+                    self.complete = True
+                    break
+        return self.complete
+
+    def value(self):
+        if not self.complete:
+            return None
+        try:
+            value = json.loads(self.buffer)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
+
+
+def dispatchable(coroutine, tool_name: str):
+    # 若本轮已提前发起了参数相同的调用，直接等待该调用的结果
+
+    async def call_tool(**arguments):
+        dispatcher = (ensure_config().get("configurable")
+                      or {}).get("tool_dispatcher")
+        task = dispatcher.claim(tool_name,
+                                arguments) if dispatcher else None
+        if task is not None:
+            return await task
+        return await coroutine(**arguments)
+
+    call_tool.dispatch_target = coroutine
+    return call_tool
+
+
+class ToolCallDispatcher:
+    # 模型仍在输出时，参数已完整且符合 schema 的工具调用立即开始执行；
+    # ToolNode 随后按原顺序调用工具时取走对应结果
+
+    def __init__(self, tools: list):
+        self._tools = {
+            tool.name: tool
+            for tool in tools if isinstance(tool.args_schema, dict)
+            and hasattr(tool.coroutine, "dispatch_target")
+        }
+        self._validators = {}
+        self._calls = {}
+        self._tasks: dict[tuple, deque] = defaultdict(deque)
+
+    def _valid(self, tool, arguments: dict) -> bool:
+        try:
+            validator = self._validators.get(tool.name)
+            if validator is None:
+                schema = tool.args_schema
+                validator = self._validators[tool.name] = validator_for(
+                    schema)(schema)
+            validator.validate(arguments)
+        except ValidationError:
+            return False
+        except (SchemaError, Exception):
+            # 第三方工具的 schema 无效或引用无法解析时，该工具不再提前执行，交给 ToolNode 正常调用
+            self._tools.pop(tool.name, None)
+            return False
+        return True
+
+    def feed(self, tool_call_chunk: dict):
+        key = tool_call_chunk.get("index")
+        if key is None:
+            key = tool_call_chunk.get("id")
+        if key is None:
+            return
+        name = tool_call_chunk.get("name")
+        call = self._calls.get(key)
+        if name or call is None:
+            call = self._calls[key] = (name, ArgumentsParser())
+        name, parser = call
+        if parser.complete or not parser.feed(tool_call_chunk.get("args")
+                                              or ""):
+            return
+        tool = self._tools.get(name)
+        arguments = parser.value()
+        if tool is None or arguments is None or not self._valid(
+                tool, arguments):
+            return
+        self._tasks[(name, canonical_args(arguments))].append(
+            asyncio.create_task(tool.coroutine.dispatch_target(**arguments)))
+
+    def claim(self, tool_name: str, arguments: dict):
+        tasks = self._tasks.get((tool_name, canonical_args(arguments)))
+        if not tasks:
+            return None
+        early_dispatch_total.inc(outcome="used")
+        return tasks.popleft()
+
+    def close(self):
+        # 模型最终没有发起的调用（例如流被中断）直接取消
+        for tasks in self._tasks.values():
+            for task in tasks:
+                early_dispatch_total.inc(outcome="discarded")
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()
+                else:
+                    task.cancel()
+        self._tasks.clear()
+        self._calls.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
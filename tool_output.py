@@ -0,0 +1,63 @@
+from langchain_core.tools import StructuredTool
+from blob_store import blob_store, blob_handle, find_blob_ids
+from env import tool_output_model_max_chars, tool_output_ui_max_chars
+
+
+def tool_output_text(content) -> str:
+    if isinstance(content, list):
+        return "\n".join(str(item) for item in content)
+    return str(content or "")
+
+
+def bound_tool_output(coroutine, max_chars: int = tool_output_model_max_chars):
+    # 超长的工具输出写入本地存储，模型只看到截断内容和可继续读取的句柄
+
+    async def call_tool(**arguments):
+        content, artifact = await coroutine(**arguments)
+        text = tool_output_text(content)
+        if len(text) <= max_chars:
+            return content, artifact
+        blob_id = blob_store.put(text)
+        return (
+            f"{text[:max_chars]}\n\n[Output truncated: showing characters 0-{max_chars} of {len(text)}. "
+            f"Call read_tool_output with handle \"{blob_handle(blob_id)}\" and offset={max_chars} to read more.]",
+            artifact)
+
+    return call_tool
+
+
+async def read_tool_output(handle: str,
+                           offset: int = 0,
+                           length: int = tool_output_model_max_chars):
+    blob_ids = find_blob_ids(handle)
+    text = blob_store.get(blob_ids[0] if blob_ids else handle)
+    if text is None:
+        return f"Tool output {handle} does not exist or has expired."
+    offset = max(0, offset)
+    end = offset + min(max(1, length), tool_output_model_max_chars)
+    result = text[offset:end]
+    if end < len(text):
+        result += f"\n\n[Showing characters {offset}-{end} of {len(text)}. Call read_tool_output again with offset={end} to read more.]"
+    return result
+
+
+read_tool_output_tool = StructuredTool.from_function(
+    coroutine=read_tool_output,
+    name="read_tool_output",
+    description=
+    "Read more of a truncated tool output. `handle` is the tool-output:// handle from the truncated result, `offset` is the character offset to start from."
+)
+
+
+def preview_tool_output(content):
+    # 界面中只展示前 tool_output_ui_max_chars 个字符，完整内容通过链接按需加载
+    text = tool_output_text(content)
+    blob_ids = find_blob_ids(text)
+    if len(text) <= tool_output_ui_max_chars and not blob_ids:
+        return text, None
+    if len(text) > tool_output_ui_max_chars:
+        blob_id = blob_ids[0] if blob_ids else blob_store.put(text)
+        text = text[:tool_output_ui_max_chars] + "\n..."
+    else:
+        blob_id = blob_ids[0]
+    return text, f"tool_outputs/{blob_id}"
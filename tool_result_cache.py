@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from env import mcp_tool_cache_size, mcp_tool_cache_ttl
+from metrics import metrics
+
+tool_cache_requests = metrics.counter(
+    "mcp_playground_tool_cache_requests_total",
+    "Tool result cache lookups by result.", ("result", ))
+tool_cache_entries = metrics.gauge("mcp_playground_tool_cache_entries",
+                                   "Tool results currently cached.")
+
+
+def canonical_args(arguments: dict) -> str:
+    return json.dumps(arguments,
+                      sort_keys=True,
+                      ensure_ascii=False,
+                      separators=(",", ":"),
+                      default=str)
+
+
+def tool_cache_ttl(connection: dict, tool_name: str):
+    # "cacheTools": true | ["tool", ...] | {"tool": ttl | true | false}
+    cache_tools = connection.get("cacheTools")
+    default_ttl = connection.get("cacheTtl", mcp_tool_cache_ttl)
+    if cache_tools is True:
+        return default_ttl
+    if isinstance(cache_tools, list) and tool_name in cache_tools:
+        return default_ttl
+    if isinstance(cache_tools, dict):
+        ttl = cache_tools.get(tool_name, cache_tools.get("*", False))
+        if ttl is True:
+            return default_ttl
+        if isinstance(ttl, (int, float)) and not isinstance(ttl, bool):
+            return ttl
+    return None
+
+
+class _Flight:
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+        # Task.cancelling() needs Python 3.11
+        self.cancelled = False
+
+
+class ToolResultCache:
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._results: OrderedDict[tuple, tuple] = OrderedDict()
+        self._inflight: dict[tuple, _Flight] = {}
+
+    def _get(self, key: tuple):
+        cached = self._results.get(key)
+        if cached is None:
+            return None
+        if cached[0] < time.monotonic():
+            del self._results[key]
+            tool_cache_entries.set(len(self._results))
+            return None
+        self._results.move_to_end(key)
+        return cached
+
+    def _set(self, key: tuple, ttl: float, result):
+        self._results[key] = (time.monotonic() + ttl, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+        tool_cache_entries.set(len(self._results))
+
+    async def _fetch(self, key: tuple, ttl: float, coroutine, arguments):
+        flight = self._inflight.get(key)
+        try:
+            result = await coroutine(**arguments)
+            self._set(key, ttl, result)
+            return result
+        finally:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+
+    async def call(self, key: tuple, ttl: float, coroutine, arguments: dict):
+        cached = self._get(key)
+        if cached is not None:
+            tool_cache_requests.inc(result="hit")
+            return cached[1]
+        # identical calls in flight share one upstream request, which is
+        # only cancelled once every caller waiting on it has gone away
+        flight = self._inflight.get(key)
+        if flight is not None and (flight.task.done() or flight.cancelled):
+            flight = None
+        if flight is None:
+            tool_cache_requests.inc(result="miss")
+            flight = self._inflight[key] = _Flight(
+                asyncio.create_task(
+                    self._fetch(key, ttl, coroutine, arguments)))
+        else:
+            tool_cache_requests.inc(result="coalesced")
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # unpublish first so a caller arriving before the task unwinds
+                # starts a new flight instead of sharing a cancelled one
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                flight.cancelled = True
+                flight.task.cancel()
+
+    def wrap(self, coroutine, server_key: str, tool_name: str, ttl: float):
+
+        async def call_tool(**arguments):
+            return await self.call(
+                (server_key, tool_name, canonical_args(arguments)), ttl,
+                coroutine, arguments)
+
+        return call_tool
+
+
+tool_result_cache = ToolResultCache(max_size=mcp_tool_cache_size)
@@ -0,0 +1,125 @@
+import math
+import re
+from collections import Counter
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+from env import tool_retrieval_top_k
+
+
+def tokenize(text: str) -> list:
+    # 英文按单词切分（拆开驼峰与下划线），中文按单字和相邻两字切分
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text or "")
+    tokens = []
+    for word in re.findall(r"[A-Za-z0-9]+|[一-鿿]+", text):
+        if word.isascii():
+            tokens.append(word.lower())
+        else:
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class ToolIndex:
+    # BM25 over tool names, descriptions and argument names
+
+    def __init__(self, tools: list, k1: float = 1.5, b: float = 0.75):
+        self.tools = tools
+        self.k1 = k1
+        self.b = b
+        self._docs = [Counter(tokenize(self._document(tool))) for tool in tools]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = sum(self._lengths) / len(tools) if tools else 1
+        document_frequency = Counter(token for doc in self._docs
+                                     for token in doc)
+        self._idf = {
+            token: math.log(1 + (len(tools) - count + 0.5) / (count + 0.5))
+            for token, count in document_frequency.items()
+        }
+
+    @staticmethod
+    def _document(tool) -> str:
+        name = tool.name.split("__TOOL__")[-1]
+        return " ".join([name, name, tool.description or "", *tool.args])
+
+    def _score(self, query_tokens: list, i: int) -> float:
+        doc = self._docs[i]
+        norm = self.k1 * (1 - self.b +
+                          self.b * self._lengths[i] / (self._avg_length or 1))
+        score = 0.0
+        for token in query_tokens:
+            frequency = doc.get(token)
+            if frequency:
+                score += self._idf[token] * frequency * (self.k1 + 1) / (
+                    frequency + norm)
+        return score
+
+    def search(self, query: str, k: int, exclude=()) -> list:
+        query_tokens = set(tokenize(query))
+        scored = [(self._score(query_tokens, i), i)
+                  for i, tool in enumerate(self.tools)
+                  if tool.name not in exclude]
+        scored = sorted((item for item in scored if item[0] > 0),
+                        key=lambda item: (-item[0], item[1]))
+        return [self.tools[i] for _, i in scored[:k]]
+
+
+class ToolSelection:
+    # 每轮对话只挂载与问题最相关的 top_k 个工具，模型可调用 search_tools 扩大范围
+
+    def __init__(self, catalog, query: str, top_k: int):
+        self.catalog = catalog
+        self.top_k = top_k
+        self.names = {
+            tool.name
+            for tool in catalog.index.search(query, top_k)
+        }
+        self.widened = False
+
+    @property
+    def key(self):
+        return tuple(sorted(self.names))
+
+    @property
+    def tools(self):
+        # 保持工具目录中的顺序，相同的工具子集序列化结果一致
+        indexed = {tool.name for tool in self.catalog.index.tools}
+        tools = [
+            tool for tool in self.catalog.tools
+            if tool.name in self.names or tool.name not in indexed
+        ]
+        if len(self.names) < len(indexed):
+            tools.append(search_tools_tool)
+        return tools
+
+    def widen(self, query: str) -> list:
+        tools = self.catalog.index.search(query,
+                                          self.top_k,
+                                          exclude=self.names)
+        self.names.update(tool.name for tool in tools)
+        self.widened = self.widened or bool(tools)
+        return tools
+
+
+def select_tools(catalog, query: str, top_k: int = tool_retrieval_top_k):
+    if top_k <= 0 or len(catalog.index.tools) <= top_k:
+        return None
+    return ToolSelection(catalog, query, top_k)
+
+
+async def search_tools(query: str, config: RunnableConfig) -> str:
+    selection = (config.get("configurable") or {}).get("tool_selection")
+    if selection is None:
+        return "Tool search is not available in this conversation."
+    tools = selection.widen(query)
+    if not tools:
+        return f"No additional tools match \"{query}\". Try different keywords."
+    return "The following tools are now available:\n" + "\n".join(
+        f"- {tool.name}: {tool.description}" for tool in tools)
+
+
+search_tools_tool = StructuredTool.from_function(
+    coroutine=search_tools,
+    name="search_tools",
+    description=
+    "Only the tools most relevant to the conversation are attached. If none of them fits, search the remaining tools with keywords describing the capability you need; matching tools become callable in the next step."
+)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+from config import default_mcp_config, default_mcp_servers, model_options
+from context_manager import load_encoding
+from env import internal_mcp_config, llm_api_key, llm_base_url, llm_model_name, warmup_enabled, warmup_timeout
+from llm_pool import chat_models, resolve_model
+from mcp_client import get_mcp_prompts, merge_mcp_config, parse_mcp_config
+from mcp_pool import error_message, mcp_session_pool
+from tool_catalog import tool_catalog
+
+
+class WarmupState:
+
+    def __init__(self):
+        self.ready = False
+        self.started_at = None
+        self.finished_at = None
+        self.steps = {}
+
+    def status(self):
+        return {
+            "ready":
+            self.ready,
+            "duration":
+            round(self.finished_at - self.started_at, 3)
+            if self.finished_at else None,
+            "steps":
+            self.steps
+        }
+
+
+warmup_state = WarmupState()
+
+
+async def _step(name: str, coroutine):
+    warmup_state.steps[name] = "pending"
+    try:
+        await coroutine
+        warmup_state.steps[name] = "done"
+    except Exception as e:
+        warmup_state.steps[name] = f"failed: {error_message(e)}"
+
+
+async def _warm_mcp_server(mcp_name: str, server: dict):
+    errors = await mcp_session_pool.prespawn({mcp_name: server})
+    if errors:
+        raise errors[0]
+    async with mcp_session_pool.connect({mcp_name: server}) as client:
+        tool_catalog.get(client)
+
+
+async def _warm_mcp_catalog(mcp_servers: dict):
+    async with mcp_session_pool.connect(mcp_servers) as client:
+        tool_catalog.get(client)
+
+
+async def _warm_tokenizer():
+    task = load_encoding()
+    if task is not None:
+        await task
+
+
+async def _warm_mcp_prompts(mcp_config: dict):
+    await get_mcp_prompts(mcp_config,
+                          get_llm=lambda: chat_models.get(
+                              llm_model_name, llm_base_url, llm_api_key))
+
+
+async def warm_up():
+    warmup_state.ready = False
+    warmup_state.started_at = time.monotonic()
+    # 新打开的页面使用的配置：默认配置与内置配置合并，欢迎页用例按它生成
+    mcp_config = merge_mcp_config(json.loads(default_mcp_config),
+                                  internal_mcp_config)
+    mcp_servers = parse_mcp_config(mcp_config)
+    # 与新页面第一轮对话相同的筛选方式得到默认启用的 Server
+    default_enabled = parse_mcp_config(mcp_config, [
+        server["name"] for server in default_mcp_servers
+        if server.get("enabled")
+    ])
+    backends = {
+        resolve_model(option["value"])
+        for option in model_options
+    }
+    backends.add((llm_model_name, llm_base_url, llm_api_key))
+    try:
+        # 超时的步骤继续在后台执行，不阻塞就绪状态
+        await asyncio.wait([
+            asyncio.create_task(
+                _step(f"mcp:{mcp_name}", _warm_mcp_server(mcp_name, server)))
+            for mcp_name, server in mcp_servers.items()
+        ] + [
+            asyncio.create_task(
+                _step(f"llm:{model}@{base_url}",
+                      chat_models.warm_up(model, base_url, api_key)))
+            for model, base_url, api_key in backends
+        ] + [asyncio.create_task(_step("tokenizer", _warm_tokenizer()))],
+                           timeout=warmup_timeout)
+        # 工具列表就绪后再预先生成欢迎页用例，并缓存新页面默认启用的 Server 组合的工具目录
+        default_servers = {
+            mcp_name: server
+            for mcp_name, server in mcp_servers.items()
+            if mcp_name in default_enabled
+            and warmup_state.steps.get(f"mcp:{mcp_name}") == "done"
+        }
+        tasks = [
+            asyncio.create_task(
+                _step("mcp_prompts", _warm_mcp_prompts(mcp_config)))
+        ]
+        if default_servers:
+            tasks.append(
+                asyncio.create_task(
+                    _step("mcp_catalog", _warm_mcp_catalog(default_servers))))
+        else:
+            warmup_state.steps["mcp_catalog"] = "skipped: no default MCP server is available"
+        _, pending = await asyncio.wait(tasks, timeout=warmup_timeout)
+        if pending:
+            print('Warm-up timed out: ', warmup_state.steps)
+    finally:
+        warmup_state.ready = True
+        warmup_state.finished_at = time.monotonic()
+        print('Warm-up finished: ', warmup_state.status())
+
+
+def start_warm_up():
+    global _warmup_task
+    if not warmup_enabled:
+        warmup_state.ready = True
+        return None
+    if _warmup_task is None or _warmup_task.done():
+        _warmup_task = asyncio.create_task(warm_up())
+    return _warmup_task
+
+
+_warmup_task = None